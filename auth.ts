@@ -1,23 +1,30 @@
 // lib/auth.ts - Authentication utilities and JWT handling
 
 import jwt from 'jsonwebtoken';
-import bcrypt from 'bcryptjs';
-import { User, AuthTokens } from '@/types';
+import { User } from '@/types';
+import {
+  UserListOptions, UserListPage, compareKeys, decodeCursor, encodeCursor, searchTerms, upperBound
+} from '@/lib/pagination';
+import { PrefixIndex } from '@/lib/search';
+import { AccessClaims } from '@/lib/access-token';
+import { hashPassword, verifyPassword } from '@/lib/password';
+import { verifyAccessToken } from '@/lib/session';
 
 const JWT_SECRET = process.env.JWT_SECRET || 'fallback-secret-key';
-const JWT_REFRESH_SECRET = process.env.JWT_REFRESH_SECRET || 'fallback-refresh-key';
 
 export class AuthUtils {
+  // Both run on the bcrypt worker pool (lib/password.ts), off the event loop
   static async hashPassword(password: string): Promise<string> {
-    return bcrypt.hash(password, 12);
+    return hashPassword(password);
   }
 
   static async verifyPassword(password: string, hashedPassword: string): Promise<boolean> {
-    return bcrypt.compare(password, hashedPassword);
+    return verifyPassword(password, hashedPassword);
   }
 
-  static generateTokens(user: Omit<User, 'totalUsage' | 'createdAt'>): AuthTokens {
-    const accessToken = jwt.sign(
+  // Refresh tokens are opaque and stored server-side: see lib/refresh-tokens.ts
+  static generateAccessToken(user: Omit<User, 'totalUsage' | 'createdAt'>): string {
+    return jwt.sign(
       { 
         userId: user.id, 
         email: user.email, 
@@ -27,32 +34,17 @@ export class AuthUtils {
       JWT_SECRET,
       { expiresIn: '15m' }
     );
-
-    const refreshToken = jwt.sign(
-      { userId: user.id },
-      JWT_REFRESH_SECRET,
-      { expiresIn: '7d' }
-    );
-
-    return { accessToken, refreshToken };
   }
 
-  static verifyAccessToken(token: string): any {
+  // Cached: see lib/session.ts
+  static verifyAccessToken(token: string): AccessClaims {
     try {
-      return jwt.verify(token, JWT_SECRET);
+      return verifyAccessToken(token);
     } catch (error) {
       throw new Error('Invalid access token');
     }
   }
 
-  static verifyRefreshToken(token: string): any {
-    try {
-      return jwt.verify(token, JWT_REFRESH_SECRET);
-    } catch (error) {
-      throw new Error('Invalid refresh token');
-    }
-  }
-
   static extractTokenFromHeader(authHeader: string | undefined): string | null {
     if (!authHeader || !authHeader.startsWith('Bearer ')) {
       return null;
@@ -61,49 +53,111 @@ export class AuthUtils {
   }
 }
 
+// Normalized form used for the email index: lookups ignore case and padding
+export function normalizeEmail(email: string): string {
+  return email.trim().toLowerCase();
+}
+
+const SEED_USERS: Array<User & { passwordHash: string }> = [
+  {
+    id: '1',
+    email: 'admin@aiplatform.com',
+    name: 'Admin User',
+    role: 'admin',
+    subscription: 'Enterprise',
+    createdAt: '2024-01-15T00:00:00Z',
+    totalUsage: 15420,
+    passwordHash: '$2a$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LsEaGb.xjmtNOhgka' // password: admin123
+  },
+  {
+    id: '2',
+    email: 'user@example.com',
+    name: 'John Doe',
+    role: 'user',
+    subscription: 'Professional',
+    createdAt: '2024-03-20T00:00:00Z',
+    totalUsage: 8750,
+    passwordHash: '$2a$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LsEaGb.xjmtNOhgka' // password: user123
+  }
+];
+
+// Search results kept for the next pages of the same search; dropped on every write
+const SEARCH_CACHE_SIZE = 100;
+
 // Mock database functions (replace with actual database calls)
+// Users are indexed by id and by normalized email, so every lookup is O(1),
+// and ids come from a counter that is never reused, even after a delete.
+// A copy sorted by (createdAt, id) serves keyset pages and a word-prefix
+// index serves searches, so listing never walks the whole table.
 export class MockDB {
-  private static users: User[] = [
-    {
-      id: '1',
-      email: 'admin@aiplatform.com',
-      name: 'Admin User',
-      role: 'admin',
-      subscription: 'Enterprise',
-      createdAt: '2024-01-15T00:00:00Z',
-      totalUsage: 15420
-    },
-    {
-      id: '2', 
-      email: 'user@example.com',
-      name: 'John Doe',
-      role: 'user',
-      subscription: 'Professional',
-      createdAt: '2024-03-20T00:00:00Z',
-      totalUsage: 8750
+  private static users = new Map<string, User>();         // id -> user
+  private static idsByEmail = new Map<string, string>();  // normalized email -> id
+  private static passwords = new Map<string, string>();   // id -> password hash
+  private static ordered: User[] = [];                    // sorted by (createdAt, id)
+  private static orderedRemoved = 0;                      // deleted users still in `ordered`
+  private static searchIndex = new PrefixIndex();
+  private static searchCache = new Map<string, Set<string>>();
+  private static nextId = 1;
+
+  static {
+    for (const { passwordHash, ...user } of SEED_USERS) {
+      this.insert(user, passwordHash);
     }
-  ];
+  }
 
-  private static passwords: Record<string, string> = {
-    'admin@aiplatform.com': '$2a$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LsEaGb.xjmtNOhgka', // password: admin123
-    'user@example.com': '$2a$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LsEaGb.xjmtNOhgka' // password: user123
-  };
+  private static insert(user: User, passwordHash: string): void {
+    this.users.set(user.id, user);
+    this.idsByEmail.set(normalizeEmail(user.email), user.id);
+    this.passwords.set(user.id, passwordHash);
+    this.nextId = Math.max(this.nextId, Number(user.id) + 1);
+
+    // New users almost always sort last; only older rows need a binary search
+    const last = this.ordered[this.ordered.length - 1];
+    if (!last || compareKeys(last, user) < 0) {
+      this.ordered.push(user);
+    } else {
+      this.ordered.splice(upperBound(this.ordered, user), 0, user);
+    }
+    this.searchIndex.add(user.id, `${user.name} ${user.email}`);
+    this.searchCache.clear();
+  }
 
   static async findUserByEmail(email: string): Promise<User | null> {
-    return this.users.find(user => user.email === email) || null;
+    const id = this.idsByEmail.get(normalizeEmail(email));
+    return id === undefined ? null : this.users.get(id) || null;
   }
 
   static async findUserById(id: string): Promise<User | null> {
-    return this.users.find(user => user.id === id) || null;
+    return this.users.get(id) || null;
+  }
+
+  // Usage rows are not kept in memory; only the per-user token total
+  static addUsage(userId: string, tokensUsed: number): void {
+    const user = this.users.get(userId);
+    if (user) {
+      user.totalUsage += tokensUsed;
+    }
   }
 
   static async getPasswordHash(email: string): Promise<string | null> {
-    return this.passwords[email] || null;
+    const id = this.idsByEmail.get(normalizeEmail(email));
+    return id === undefined ? null : this.passwords.get(id) || null;
+  }
+
+  static async updatePasswordHash(email: string, passwordHash: string): Promise<void> {
+    const id = this.idsByEmail.get(normalizeEmail(email));
+    if (id !== undefined) {
+      this.passwords.set(id, passwordHash);
+    }
   }
 
   static async createUser(userData: Omit<User, 'id' | 'createdAt' | 'totalUsage'> & { password: string }): Promise<User> {
+    if (this.idsByEmail.has(normalizeEmail(userData.email))) {
+      throw new Error('User already exists with this email');
+    }
+
     const newUser: User = {
-      id: (this.users.length + 1).toString(),
+      id: (this.nextId++).toString(),
       email: userData.email,
       name: userData.name,
       role: userData.role,
@@ -112,13 +166,81 @@ export class MockDB {
       totalUsage: 0
     };
 
-    this.users.push(newUser);
-    this.passwords[userData.email] = userData.password;
-
+    this.insert(newUser, userData.password);
     return newUser;
   }
 
+  static async deleteUser(id: string): Promise<boolean> {
+    const user = this.users.get(id);
+    if (!user) {
+      return false;
+    }
+    this.users.delete(id);
+    this.idsByEmail.delete(normalizeEmail(user.email));
+    this.passwords.delete(id);
+    // Deleted rows are skipped by listUsers and swept out once they pile up
+    this.orderedRemoved++;
+    if (this.orderedRemoved > 1000 && this.orderedRemoved * 4 > this.ordered.length) {
+      this.ordered = this.ordered.filter(row => this.users.get(row.id) === row);
+      this.orderedRemoved = 0;
+    }
+    this.searchIndex.remove(id);
+    this.searchCache.clear();
+    return true;
+  }
+
+  private static search(terms: string[]): Set<string> {
+    const key = terms.join(' ');
+    let ids = this.searchCache.get(key);
+    if (!ids) {
+      if (this.searchCache.size >= SEARCH_CACHE_SIZE) {
+        this.searchCache.clear();
+      }
+      ids = this.searchIndex.search(terms);
+      this.searchCache.set(key, ids);
+    }
+    return ids;
+  }
+
+  static async listUsers({ limit, cursor, search }: UserListOptions): Promise<UserListPage> {
+    const after = cursor ? decodeCursor(cursor) : null;
+    const terms = searchTerms(search);
+    const matches = terms.length ? this.search(terms) : null;
+
+    // Few matches: sort just those. Many: walk the ordered table and skip the rest.
+    let rows = this.ordered;
+    if (matches && matches.size * 8 < this.ordered.length) {
+      rows = [];
+      matches.forEach(id => rows.push(this.users.get(id)!));
+      rows.sort(compareKeys);
+    }
+    const filter = rows === this.ordered ? matches : null;
+
+    // One row past the page tells whether there is a next page
+    const users: User[] = [];
+    for (let i = after ? upperBound(rows, after) : 0; i < rows.length && users.length <= limit; i++) {
+      const row = rows[i];
+      if (this.users.get(row.id) === row && (!filter || filter.has(row.id))) {
+        users.push(row);
+      }
+    }
+    const hasMore = users.length > limit;
+    if (hasMore) {
+      users.pop();
+    }
+    return {
+      users,
+      limit,
+      total: matches ? matches.size : this.users.size,
+      nextCursor: hasMore ? encodeCursor(users[users.length - 1]) : null
+    };
+  }
+
+  static async countUsers(): Promise<number> {
+    return this.users.size;
+  }
+
   static async getAllUsers(): Promise<User[]> {
-    return this.users;
+    return Array.from(this.users.values());
   }
 }
\ No newline at end of file
@@ -0,0 +1,139 @@
+# Generator benchmark with per-stage timings and output budgets
+#
+# Generates the project into a scratch folder (cold run, then an incremental
+# warm run on the same folder), repeats that a few times and records the
+# median render / write time per stage together with the size of the output:
+# total bytes, bytes and file counts per directory and per extension. The
+# result is plain JSON so it can be diffed across revisions, and budgets make
+# the run fail when the generated app grows or slows down past a limit.
+#
+#   python generate.py --benchmark bench.json --budgets budgets.json
+#
+# Budget file keys (all optional):
+#   {"max_total_bytes": 60000, "max_file_bytes": 20000, "max_files": 30,
+#    "max_total_ms": 500, "directories": {"pages/api": 15000},
+#    "stages": {"docs": 50}}            # stage budgets are in ms
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+from emitter import FileEmitter
+
+BUDGET_KEYS = ("max_total_bytes", "max_file_bytes", "max_files", "max_total_ms",
+               "directories", "stages")
+
+
+def _timed_run(root, order, run_stages):
+    emitter = FileEmitter(root)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_stages(emitter, order)
+        emitter.close()
+    return emitter, time.perf_counter() - start
+
+
+def output_breakdown(files):
+    """Byte and file counts per file, per directory (cumulative) and per extension."""
+    directories, directory_files, extensions = {}, {}, {}
+    for filepath, entry in files.items():
+        size = entry["size"]
+        parts = filepath.split("/")[:-1]
+        for depth in range(len(parts) + 1):
+            directory = "/".join(parts[:depth]) or "."
+            directories[directory] = directories.get(directory, 0) + size
+            directory_files[directory] = directory_files.get(directory, 0) + 1
+        ext = os.path.splitext(filepath)[1] or os.path.basename(filepath)
+        counts = extensions.setdefault(ext, {"files": 0, "bytes": 0})
+        counts["files"] += 1
+        counts["bytes"] += size
+    return {
+        "bytes_by_directory": dict(sorted(directories.items())),
+        "files_by_directory": dict(sorted(directory_files.items())),
+        "by_extension": dict(sorted(extensions.items())),
+        "bytes_by_file": {path: files[path]["size"] for path in sorted(files)},
+    }
+
+
+def run_benchmark(order, run_stages, repeat=5):
+    cold_runs, warm_runs = [], []
+    stage_samples = {name: {"render_ms": [], "write_ms": []} for name in order}
+    files = {}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="scaffold-bench-") as tmp:
+            root = os.path.join(tmp, "project")
+            emitter, elapsed = _timed_run(root, order, run_stages)
+            cold_runs.append(elapsed * 1000)
+            for name in order:
+                stats = emitter.stats.get(name)
+                if stats is not None:
+                    stage_samples[name]["render_ms"].append(stats.render_seconds * 1000)
+                    stage_samples[name]["write_ms"].append(stats.write_seconds * 1000)
+            files = emitter.manifest.current
+            stage_totals = {name: emitter.stats[name] for name in order if name in emitter.stats}
+
+            _, elapsed = _timed_run(root, order, run_stages)
+            warm_runs.append(elapsed * 1000)
+
+    stages = {}
+    for name, stats in stage_totals.items():
+        render_ms = statistics.median(stage_samples[name]["render_ms"])
+        write_ms = statistics.median(stage_samples[name]["write_ms"])
+        stages[name] = {
+            "render_ms": round(render_ms, 3),
+            "write_ms": round(write_ms, 3),
+            "total_ms": round(render_ms + write_ms, 3),
+            "files": stats.files,
+            "bytes": stats.bytes_rendered,
+        }
+
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "total": {
+            "cold_ms": round(statistics.median(cold_runs), 3),
+            "warm_ms": round(statistics.median(warm_runs), 3),
+            "files": len(files),
+            "bytes": sum(entry["size"] for entry in files.values()),
+        },
+        "stages": stages,
+        **output_breakdown(files),
+    }
+
+
+def load_budgets(path):
+    with open(path, encoding="utf-8") as f:
+        budgets = json.load(f)
+    unknown = set(budgets) - set(BUDGET_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown budget keys: {', '.join(sorted(unknown))}")
+    return budgets
+
+
+def check_budgets(result, budgets):
+    """Return a list of human readable budget violations (empty when all pass)."""
+    violations = []
+    total = result["total"]
+
+    def over(label, value, limit, unit):
+        if limit is not None and value > limit:
+            violations.append(f"{label}: {value:g} {unit} > budget {limit:g} {unit}")
+
+    over("total size", total["bytes"], budgets.get("max_total_bytes"), "bytes")
+    over("file count", total["files"], budgets.get("max_files"), "files")
+    over("cold run time", total["cold_ms"], budgets.get("max_total_ms"), "ms")
+    if budgets.get("max_file_bytes") is not None:
+        for path, size in result["bytes_by_file"].items():
+            over(f"file {path}", size, budgets["max_file_bytes"], "bytes")
+    for directory, limit in budgets.get("directories", {}).items():
+        over(f"directory {directory}", result["bytes_by_directory"].get(directory, 0), limit, "bytes")
+    for name, limit in budgets.get("stages", {}).items():
+        if name in result["stages"]:
+            over(f"stage {name}", result["stages"][name]["total_ms"], limit, "ms")
+    return violations
@@ -0,0 +1,306 @@
+# Shared file emitter for the generator scripts
+#
+# All stages hand their rendered files to one FileEmitter. Writes run on a
+# thread pool and go to a temporary sibling that is renamed over the target,
+# so a crash mid-run never leaves a truncated file behind. Writes are also
+# incremental: files whose content matches the manifest from the previous run
+# are skipped and keep their mtimes.
+#
+# With a SharedStore, file contents are kept once in a content-addressed
+# folder and hardlinked (or reflinked) into place, so byte-identical files
+# shared by many generated trees take the disk space and write I/O of one.
+import errno
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from manifest import Manifest, content_hash
+
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks, fall back to copying
+    fcntl = None
+
+TMP_SUFFIX = ".scaffold-tmp"
+FICLONE = 0x40049409  # Linux ioctl: share the extents of another file (btrfs, XFS)
+LINK_MODES = ("hardlink", "reflink", "copy")
+
+_active = None
+
+
+@dataclass
+class StageStats:
+    files: int = 0
+    written: int = 0
+    unchanged: int = 0
+    bytes_rendered: int = 0
+    bytes_written: int = 0
+    render_seconds: float = 0.0
+    write_seconds: float = 0.0
+
+    @property
+    def seconds(self):
+        return self.render_seconds + self.write_seconds
+
+
+def write_atomic(full_path, data):
+    """Write ``data`` to a temporary sibling and rename it over ``full_path``."""
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    tmp_path = full_path + TMP_SUFFIX
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, full_path)
+
+
+def reflink_or_copy(src, dst):
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return
+            except OSError as error:
+                if error.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV,
+                                       errno.EINVAL, errno.ENOSYS):
+                    raise
+        shutil.copyfileobj(fsrc, fdst)
+
+
+class SharedStore:
+    """Content-addressed blobs that generated files are linked to.
+
+    Safe to share between threads and processes: blobs are written under a
+    unique temporary name and renamed into place, and identical content
+    always lands at the same path.
+    """
+
+    def __init__(self, root, mode="hardlink"):
+        if mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode: {mode!r}")
+        self.root = root
+        self.mode = mode
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _ensure_blob(self, digest, data):
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob), suffix=TMP_SUFFIX)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, blob)
+        return blob
+
+    def place(self, digest, data, full_path):
+        """Make ``full_path`` a link to (or clone of) the blob for ``data``."""
+        if self.mode == "copy":
+            write_atomic(full_path, data)
+            return
+        blob = self._ensure_blob(digest, data)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = full_path + TMP_SUFFIX
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        if self.mode == "hardlink":
+            try:
+                os.link(blob, tmp_path)
+            except OSError:
+                # Different filesystem or links not supported
+                shutil.copyfile(blob, tmp_path)
+        else:
+            reflink_or_copy(blob, tmp_path)
+        os.replace(tmp_path, full_path)
+
+    def prune(self):
+        """Drop blobs no tree links to any more (hardlink mode only).
+
+        Returns (blobs kept, bytes saved by sharing).
+        """
+        kept = saved = 0
+        if self.mode != "hardlink" or not os.path.isdir(self.root):
+            return kept, saved
+        for bucket in os.scandir(self.root):
+            if not bucket.is_dir():
+                continue
+            for blob in os.scandir(bucket.path):
+                st = blob.stat(follow_symlinks=False)
+                if st.st_nlink <= 1:
+                    os.remove(blob.path)
+                    continue
+                kept += 1
+                # One link is the store itself, one is the first real copy
+                saved += st.st_size * max(0, st.st_nlink - 2)
+        return kept, saved
+
+
+class BaseEmitter:
+    """Stage bookkeeping shared by every output sink.
+
+    Subclasses implement write(), make_dirs() and close(); flush() waits for
+    outstanding writes and is a no-op for sinks that write synchronously.
+    """
+
+    root = None
+
+    def __init__(self):
+        self.stats = {}
+        self.outputs = {}  # file path -> stage that produced it
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def current_stage(self):
+        return getattr(self._local, "stage", "main")
+
+    def _stats(self, stage):
+        with self._lock:
+            return self.stats.setdefault(stage, StageStats())
+
+    @contextmanager
+    def stage(self, name):
+        """Attribute writes made inside the block to stage ``name``.
+
+        The stage's writes are flushed when the block exits. Time spent in the
+        block is recorded as render time, and the wait for the stage's
+        outstanding writes as write time.
+        """
+        previous = self.current_stage
+        self._local.stage = name
+        stats = self._stats(name)
+        start = time.perf_counter()
+        try:
+            yield stats
+            rendered = time.perf_counter()
+            stats.render_seconds += rendered - start
+            self.flush(name)
+            stats.write_seconds += time.perf_counter() - rendered
+        finally:
+            self._local.stage = previous
+
+    def _count(self, filepath, data):
+        stats = self._stats(self.current_stage)
+        with self._lock:
+            self.outputs[filepath] = self.current_stage
+            stats.files += 1
+            stats.bytes_rendered += len(data)
+        return stats
+
+    def write_files(self, files):
+        for filepath, content in files.items():
+            self.write(filepath, content)
+
+    def flush(self, stage=None):
+        pass
+
+    def totals(self):
+        total = StageStats()
+        for stats in self.stats.values():
+            total.files += stats.files
+            total.written += stats.written
+            total.unchanged += stats.unchanged
+            total.bytes_rendered += stats.bytes_rendered
+            total.bytes_written += stats.bytes_written
+        return total
+
+
+class FileEmitter(BaseEmitter):
+    """Writes the project into a folder: parallel, atomic and incremental."""
+
+    def __init__(self, root, clean=False, max_workers=None, store=None):
+        super().__init__()
+        if clean and os.path.exists(root):
+            shutil.rmtree(root)
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.store = store
+        self.manifest = Manifest(root)
+        self.removed = None
+        self.written_paths = []
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="emit")
+        self._pending = {}
+
+    def make_dirs(self, directories):
+        for directory in directories:
+            os.makedirs(os.path.join(self.root, directory), exist_ok=True)
+
+    def write(self, filepath, content):
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        digest = content_hash(data)
+        self.manifest.record(filepath, digest, len(data))
+        stats = self._count(filepath, data)
+        future = self._pool.submit(self._write, stats, filepath, digest, data)
+        with self._lock:
+            self._pending.setdefault(self.current_stage, []).append(future)
+        return future
+
+    def _write(self, stats, filepath, digest, data):
+        if self.manifest.is_current(filepath, digest, len(data)):
+            with self._lock:
+                stats.unchanged += 1
+            return False
+        full_path = os.path.join(self.root, filepath)
+        if self.store is not None:
+            self.store.place(digest, data, full_path)
+        else:
+            write_atomic(full_path, data)
+        with self._lock:
+            self.written_paths.append(filepath)
+            stats.written += 1
+            stats.bytes_written += len(data)
+        return True
+
+    def remove(self, filepath):
+        """Delete a previously generated file and forget it in the manifest."""
+        self.manifest.previous.pop(filepath, None)
+        self.manifest.current.pop(filepath, None)
+        try:
+            os.remove(os.path.join(self.root, filepath))
+        except FileNotFoundError:
+            pass
+
+    def flush(self, stage=None):
+        """Wait for pending writes (of one stage, or all) and re-raise errors."""
+        with self._lock:
+            if stage is None:
+                futures = [f for fs in self._pending.values() for f in fs]
+                self._pending.clear()
+            else:
+                futures = self._pending.pop(stage, [])
+        for future in futures:
+            future.result()
+
+    def close(self, prune=True):
+        """Finish all writes and save the manifest. Safe to call twice.
+
+        Returns the files removed because they are no longer generated.
+        """
+        if self.removed is None:
+            self.flush()
+            self._pool.shutdown()
+            self.removed = self.manifest.save(prune=prune)
+        return self.removed
+
+
+def get_emitter(root, clean=False):
+    """Return the emitter installed by the driver, or a new one for ``root``."""
+    if _active is not None:
+        return _active
+    return FileEmitter(root, clean=clean)
+
+
+@contextmanager
+def activate(emitter):
+    """Make ``emitter`` the one returned by get_emitter() inside the block."""
+    global _active
+    previous, _active = _active, emitter
+    try:
+        yield emitter
+    finally:
+        _active = previous
@@ -0,0 +1,285 @@
+# Single-process generation driver
+#
+# Runs the generator scripts as the stages of a declared dependency graph in
+# one interpreter. The stages share a namespace, exactly like the notebook
+# cells they started out as (script_1.py .. script_4.py use `os`, `project_name`
+# and `emitter` from script.py), and every file write goes through one shared
+# parallel, atomic FileEmitter.
+#
+#   python generate.py                 # full run
+#   python generate.py --only api      # run the api stage and its dependencies
+#   python generate.py --benchmark bench.json --budgets budgets.json
+#   python generate.py --tenants tenants.json --out tenants --jobs 4
+#   python generate.py --archive ai-saas-platform.zip   (or "-" for stdout)
+#   python generate.py --watch         # re-render only what changed on every save
+#   python generate.py --validate      # check the emitted TypeScript imports
+#   python generate.py --precompress   # also emit .br / .gz copies of the static assets (needs brotli)
+#   python generate.py --edge-auth     # middleware that verifies JWTs with Web Crypto (edge runtime)
+import argparse
+import contextlib
+import dataclasses
+import json
+import os
+import sys
+import time
+
+import archive
+import batch
+import benchmark
+import precompress
+from emitter import LINK_MODES, FileEmitter, activate
+import tenants
+from tenants import current_tenant, load_tenants
+from tree_walk import format_size
+from validate_imports import check_tree
+from watch import Watcher
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# stage name -> (script, stages it depends on)
+STAGES = {
+    "structure": ("script.py", []),
+    "config": ("script_1.py", ["structure"]),
+    "types": ("script_2.py", ["structure"]),
+    "api": ("script_3.py", ["structure"]),
+    "docs": ("script_4.py", ["structure"]),
+    # Only does work for tenants with precompress enabled
+    "compress": ("script_6.py", ["docs"]),
+    "report": ("script_5.py", ["config", "types", "api", "docs", "compress"]),
+}
+
+
+def resolve_order(stages, only=None):
+    """Topologically sort ``stages``; with ``only``, keep those and their deps."""
+    wanted = set(stages) if not only else set()
+    todo = list(only or [])
+    while todo:
+        name = todo.pop()
+        if name not in stages:
+            raise ValueError(f"Unknown stage: {name}")
+        if name not in wanted:
+            wanted.add(name)
+            todo.extend(stages[name][1])
+
+    order, done, visiting = [], set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Stage dependency cycle at: {name}")
+        visiting.add(name)
+        for dep in stages[name][1]:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+        order.append(name)
+
+    for name in stages:
+        if name in wanted:
+            visit(name)
+    return order
+
+
+_stage_cache = {}
+
+
+def load_stage(script):
+    """Compile a stage script once per process (recompiled when it changes on disk).
+
+    Reusing the code object also reuses its template string constants, so the
+    compiled templates are found in the template cache without rehashing.
+    """
+    path = os.path.join(HERE, script)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _stage_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, encoding="utf-8") as f:
+            cached = _stage_cache[path] = (mtime, compile(f.read(), path, "exec"))
+    return cached[1]
+
+
+def run_stages(emitter, order, namespace=None):
+    """Execute the stages in ``order`` in one shared namespace.
+
+    Returns the namespace, so callers can look at the rendered templates.
+    """
+    namespace = namespace if namespace is not None else {"__name__": "__main__"}
+    with activate(emitter):
+        for name in order:
+            script = STAGES[name][0]
+            code = load_stage(script)
+            namespace["__file__"] = os.path.join(HERE, script)
+            with emitter.stage(name):
+                exec(code, namespace)
+    return namespace
+
+
+def print_report(emitter, order, elapsed):
+    print("\n⏱️  Generation report:")
+    print(f"   {'stage':<10} {'time':>9} {'files':>6} {'written':>8} {'bytes written':>14}")
+    for name in order:
+        stats = emitter.stats.get(name)
+        if stats is None:
+            continue
+        print(f"   {name:<10} {stats.seconds * 1000:>7.1f}ms {stats.files:>6} "
+              f"{stats.written:>8} {format_size(stats.bytes_written):>14}")
+    total = emitter.totals()
+    print(f"   {'total':<10} {elapsed * 1000:>7.1f}ms {total.files:>6} "
+          f"{total.written:>8} {format_size(total.bytes_written):>14}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the AI SaaS platform project.")
+    parser.add_argument("--only", action="append", choices=sorted(STAGES),
+                        help="run only this stage and its dependencies (repeatable)")
+    parser.add_argument("--clean", action="store_true",
+                        help="wipe the output folder before generating")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of writer threads")
+    parser.add_argument("--benchmark", metavar="JSON",
+                        help="benchmark the generator in a scratch folder and write the results here")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="benchmark iterations (default: 5)")
+    parser.add_argument("--budgets", metavar="JSON",
+                        help="budget file; the benchmark fails when a budget is exceeded")
+    parser.add_argument("--max-total-bytes", type=int, help="budget for the total output size")
+    parser.add_argument("--max-total-ms", type=float, help="budget for a cold generation run")
+    parser.add_argument("--tenants", metavar="JSON",
+                        help="generate one project per tenant listed in this file")
+    parser.add_argument("--out", default="tenants",
+                        help="output folder for --tenants (default: tenants)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="worker processes for --tenants")
+    parser.add_argument("--link", choices=LINK_MODES, default="hardlink",
+                        help="how files shared between tenants are placed (default: hardlink)")
+    parser.add_argument("--archive", metavar="PATH",
+                        help='stream the project into a zip / tar / tar.gz archive ("-" for stdout)')
+    parser.add_argument("--archive-format", choices=archive.ARCHIVE_FORMATS,
+                        help="archive format (default: from the --archive file name)")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and re-render the stages whose script changed")
+    parser.add_argument("--debounce", type=float, default=0.3,
+                        help="seconds a script must stay unchanged before rebuilding (default: 0.3)")
+    parser.add_argument("--validate", action="store_true",
+                        help="after generating, check that every TypeScript import resolves")
+    parser.add_argument("--precompress", action="store_true",
+                        help="emit brotli / gzip copies of the static assets with immutable cache headers (needs brotli)")
+    parser.add_argument("--edge-auth", action="store_true",
+                        help="emit middleware that verifies tokens with Web Crypto, for the edge runtime")
+    args = parser.parse_args(argv)
+    if args.precompress and precompress.brotli is None:
+        parser.error("--precompress needs the brotli package: pip install brotli")
+
+    # --tenants files set these per tenant instead
+    overrides = {name: True for name in ("precompress", "edge_auth") if getattr(args, name)}
+    if overrides:
+        with tenants.activate(dataclasses.replace(current_tenant(), **overrides)):
+            return _main(args)
+    return _main(args)
+
+
+def _main(args):
+    order = resolve_order(STAGES, args.only)
+    if args.watch:
+        Watcher(STAGES, order, run_stages, current_tenant().name, debounce=args.debounce).run()
+        return 0
+    if args.archive:
+        return run_archive(args, order)
+    if args.benchmark:
+        return run_benchmark(args, order)
+    if args.tenants:
+        return run_tenants(args, order)
+
+    emitter = FileEmitter(current_tenant().name, clean=args.clean, max_workers=args.workers)
+    start = time.perf_counter()
+    try:
+        run_stages(emitter, order)
+    except BaseException:
+        # Keep what was written, but never prune after a failed run
+        emitter.close(prune=False)
+        raise
+    # A partial run must not delete the files owned by stages it skipped
+    emitter.close(prune=args.only is None)
+    print_report(emitter, order, time.perf_counter() - start)
+    if args.validate:
+        return check_tree(emitter.root)
+    return 0
+
+
+def run_benchmark(args, order):
+    if args.repeat < 1:
+        raise SystemExit("--repeat must be at least 1")
+    budgets = benchmark.load_budgets(args.budgets) if args.budgets else {}
+    if args.max_total_bytes is not None:
+        budgets["max_total_bytes"] = args.max_total_bytes
+    if args.max_total_ms is not None:
+        budgets["max_total_ms"] = args.max_total_ms
+
+    result = benchmark.run_benchmark(order, run_stages, repeat=args.repeat)
+    violations = benchmark.check_budgets(result, budgets)
+    result["budgets"] = budgets
+    result["violations"] = violations
+    with open(args.benchmark, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+        f.write("\n")
+
+    total = result["total"]
+    print(f"📊 Benchmark ({args.repeat} runs): cold {total['cold_ms']:.1f}ms, "
+          f"warm {total['warm_ms']:.1f}ms, {total['files']} files, "
+          f"{format_size(total['bytes'])} -> {args.benchmark}")
+    for name, stats in result["stages"].items():
+        print(f"   {name:<10} render {stats['render_ms']:>7.2f}ms  write {stats['write_ms']:>7.2f}ms  "
+              f"{format_size(stats['bytes']):>9}")
+    if violations:
+        print("❌ Budget exceeded:")
+        for violation in violations:
+            print(f"   • {violation}")
+        return 1
+    return 0
+
+
+def run_archive(args, order):
+    fmt = args.archive_format or archive.archive_format(args.archive)
+    # The report stage walks the output folder, which does not exist here
+    order = [name for name in order if name != "report"]
+    to_stdout = args.archive == "-"
+    # Progress output goes to stderr when the archive itself goes to stdout
+    out = sys.stdout.buffer
+    log = sys.stderr if to_stdout else sys.stdout
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        if to_stdout:
+            emitter = archive.write_archive(out, fmt, run_stages, order, current_tenant().name)
+            out.flush()
+        else:
+            with open(args.archive, "wb") as f:
+                emitter = archive.write_archive(f, fmt, run_stages, order, current_tenant().name)
+        total = emitter.totals()
+        print(f"📦 Archived {total.files} files ({format_size(total.bytes_rendered)}) as {fmt} "
+              f"in {(time.perf_counter() - start) * 1000:.1f}ms -> {args.archive}")
+    return 0
+
+
+def run_tenants(args, order):
+    tenant_list = load_tenants(args.tenants)
+    # The report stage prints the tree of a single project; skip it per tenant
+    order = [name for name in order if name != "report"]
+    start = time.perf_counter()
+    results, store = batch.run_batch(tenant_list, args.out, order, run_stages,
+                                     jobs=args.jobs, link_mode=args.link)
+    elapsed = time.perf_counter() - start
+
+    print(f"🏢 Generated {len(results)} tenants in {elapsed * 1000:.1f}ms -> {args.out}/")
+    for result in results:
+        print(f"   ├── {result['tenant']:<24} {result['files']:>4} files "
+              f"{result['written']:>4} written {format_size(result['bytes']):>9} "
+              f"{result['seconds'] * 1000:>7.1f}ms")
+    if args.link == "hardlink":
+        print(f"   🔗 {store['shared_blobs']} shared blobs, "
+              f"{format_size(store['saved_bytes'])} saved by hardlinking")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
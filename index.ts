@@ -74,4 +74,11 @@ export interface AdminStats {
   revenueThisMonth: number;
   userGrowth: number;
   usageByTool: Record<string, number>;
+}
+
+export interface UsagePoint {
+  bucket: string;
+  tool: string;
+  requests: number;
+  tokens: number;
 }
\ No newline at end of file
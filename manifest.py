@@ -0,0 +1,79 @@
+# Content-hash manifest for incremental project generation
+#
+# Every rendered template is hashed and compared against the manifest left in
+# the output folder by the previous run. Only files whose content changed are
+# written, so unchanged files keep their mtimes and the Next.js / tsc
+# incremental caches stay warm. Files that are no longer generated are removed
+# when the manifest is saved.
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = ".scaffold-manifest.json"
+
+
+def content_hash(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+class Manifest:
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self.previous = self._load()
+        self.current = {}
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data.get("files", {})
+
+    def is_current(self, filepath, digest, size):
+        # A file is up to date when the previous run produced the same hash and
+        # the file on disk still has the recorded size (cheap guard against
+        # manual edits or deletions, without reading the file back).
+        entry = self.previous.get(filepath)
+        if not entry or entry["sha256"] != digest:
+            return False
+        try:
+            return os.stat(os.path.join(self.root, filepath)).st_size == size
+        except OSError:
+            return False
+
+    def record(self, filepath, digest, size):
+        self.current[filepath] = {"sha256": digest, "size": size}
+
+    def stale_files(self):
+        return sorted(set(self.previous) - set(self.current))
+
+    def save(self, prune=True):
+        """Store the manifest for the next run.
+
+        With ``prune`` (a full run) files left over from the previous run are
+        deleted; otherwise (a partial run) their entries are carried over.
+        Returns the list of removed paths.
+        """
+        removed = []
+        for filepath in self.stale_files():
+            if not prune:
+                self.current[filepath] = self.previous[filepath]
+                continue
+            try:
+                os.remove(os.path.join(self.root, filepath))
+            except FileNotFoundError:
+                pass
+            removed.append(filepath)
+
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "files": self.current}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+        self.previous = dict(self.current)
+        return removed
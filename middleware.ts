@@ -2,9 +2,7 @@
 
 import { NextResponse } from 'next/server';
 import type { NextRequest } from 'next/server';
-import jwt from 'jsonwebtoken';
-
-const JWT_SECRET = process.env.JWT_SECRET || 'fallback-secret-key';
+import { accessToken, authenticate } from '@/lib/session';
 
 // Routes that require authentication
 const protectedRoutes = ['/dashboard', '/admin', '/profile'];
@@ -19,9 +17,8 @@ export function middleware(request: NextRequest) {
   const isAdminRoute = adminRoutes.some(route => pathname.startsWith(route));
   const isAuthRoute = authRoutes.some(route => pathname.startsWith(route));
 
-  // Get token from cookies or headers
-  const token = request.cookies.get('accessToken')?.value || 
-                request.headers.get('authorization')?.replace('Bearer ', '');
+  // Get token from cookies or headers (the session cookie wins, as pages are reached with it)
+  const token = request.cookies.get('accessToken')?.value || accessToken(request.headers.get('authorization'));
 
   // If accessing protected route without token, redirect to login
   if (isProtectedRoute && !token) {
@@ -30,11 +27,10 @@ export function middleware(request: NextRequest) {
     return NextResponse.redirect(loginUrl);
   }
 
-  // If token exists, verify it
+  // If token exists, verify it (cached per token until it expires)
   if (token) {
-    try {
-      const decoded = jwt.verify(token, JWT_SECRET) as any;
-
+    const decoded = authenticate(token);
+    if (decoded) {
       // If user is authenticated and trying to access auth routes, redirect to dashboard
       if (isAuthRoute) {
         return NextResponse.redirect(new URL('/dashboard', request.url));
@@ -44,14 +40,11 @@ export function middleware(request: NextRequest) {
       if (isAdminRoute && decoded.role !== 'admin') {
         return NextResponse.redirect(new URL('/dashboard', request.url));
       }
-
-    } catch (error) {
-      // Invalid token - redirect to login if accessing protected route
-      if (isProtectedRoute) {
-        const loginUrl = new URL('/auth/login', request.url);
-        loginUrl.searchParams.set('redirect', pathname);
-        return NextResponse.redirect(loginUrl);
-      }
+    } else if (isProtectedRoute) {
+      // Invalid token - redirect to login
+      const loginUrl = new URL('/auth/login', request.url);
+      loginUrl.searchParams.set('redirect', pathname);
+      return NextResponse.redirect(loginUrl);
     }
   }
 
@@ -0,0 +1,99 @@
+# Precompressed static assets for the generated project
+#
+# The opt-in "compress" stage takes the static files the generated pages
+# link to (today the landing page icon, see script_4.py), copies them into
+# public/assets/ under content-hashed names and writes .br and .gz siblings
+# next to each copy, so the server never compresses them per request. The
+# pages link the hashed URL (asset_url()), which is what makes the
+# immutable caching safe. public/assets/precompressed.json maps each source
+# file to its hashed copy and compressed variants, with their sizes and
+# sha256 hashes.
+#
+# Only files Next.js serves as-is belong here: anything it bundles itself
+# (styles/globals.css, pages/) would just be published as a second copy.
+#
+# The generated next.config.js (see script_1.py) rewrites requests to the
+# best variant the client accepts and marks the hashed URLs as immutable.
+# Brotli needs the `brotli` package (pip install brotli). It is only imported
+# for this stage, and the stage fails without it rather than emitting gzip
+# alone: the output must not depend on what the generating machine has
+# installed.
+#
+#   python generate.py --precompress
+import gzip
+import json
+import posixpath
+
+from manifest import content_hash
+
+try:
+    import brotli
+except ImportError:  # only --precompress needs it; encodings() reports it missing
+    brotli = None
+
+ASSET_DIR = "public/assets"
+MANIFEST_PATH = f"{ASSET_DIR}/precompressed.json"
+
+CONTENT_TYPES = {
+    "svg": "image/svg+xml",
+}
+
+
+def _gzip(data):
+    # mtime=0 keeps the output byte-identical across runs (and hardlinkable)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+def encodings():
+    """(Content-Encoding, file suffix, compress function), most preferred first."""
+    if brotli is None:
+        raise RuntimeError("Precompressed assets need the brotli package: pip install brotli")
+    return [("br", "br", _brotli), ("gzip", "gz", _gzip)]
+
+
+def hashed_name(relpath, digest):
+    """public/favicon.svg -> public/assets/favicon.<hash>.svg"""
+    stem, ext = posixpath.splitext(posixpath.basename(relpath))
+    return f"{ASSET_DIR}/{stem}.{digest[:8]}{ext}"
+
+
+def _url(path):
+    return "/" + path[len("public/"):]
+
+
+def _encode(content):
+    return content.encode("utf-8") if isinstance(content, str) else content
+
+
+def asset_url(relpath, content):
+    """The URL the pages link for ``relpath``: its hashed copy under /assets/."""
+    return _url(hashed_name(relpath, content_hash(_encode(content))))
+
+
+def _entry(path, data):
+    return {"path": _url(path), "sha256": content_hash(data), "size": len(data)}
+
+
+def precompress_assets(assets):
+    """Return the files to write for ``assets`` ({source path: content})."""
+    files = {}
+    manifest = {}
+    for relpath, content in assets.items():
+        ext = posixpath.splitext(relpath)[1].lstrip(".")
+        if ext not in CONTENT_TYPES:
+            raise ValueError(f"No content type for precompressed asset: {relpath}")
+        data = _encode(content)
+        target = hashed_name(relpath, content_hash(data))
+        files[target] = data
+        entry = manifest[relpath] = _entry(target, data)
+        entry["variants"] = {}
+        for encoding, suffix, compress in encodings():
+            compressed = compress(data)
+            files[f"{target}.{suffix}"] = compressed
+            entry["variants"][encoding] = _entry(f"{target}.{suffix}", compressed)
+    files[MANIFEST_PATH] = json.dumps(manifest, indent=2, sort_keys=True) + "\n"
+    return files
@@ -46,6 +46,16 @@ CREATE TABLE user_settings (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Monthly credit balances; credits_used includes credits leased to app servers
+CREATE TABLE credit_balances (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    period VARCHAR(7) NOT NULL, -- 'YYYY-MM'
+    credits_limit INTEGER NOT NULL, -- -1 for unlimited
+    credits_used INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, period)
+);
+
 -- API keys and integrations (for admin)
 CREATE TABLE api_configurations (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
@@ -71,14 +81,16 @@ CREATE TABLE subscriptions (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Refresh tokens for JWT authentication
+-- Refresh tokens for JWT authentication (rotated on every use, see lib/refresh-tokens.ts)
 CREATE TABLE refresh_tokens (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
     user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    token_hash VARCHAR(255) NOT NULL,
+    family_id UUID NOT NULL, -- every token rotated from the same login
+    token_hash VARCHAR(255) NOT NULL UNIQUE, -- sha256 of the token; the token itself is never stored
     expires_at TIMESTAMP NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    last_used TIMESTAMP
+    last_used TIMESTAMP, -- when it was exchanged for its successor
+    revoked_at TIMESTAMP
 );
 
 -- Audit logs for admin activities
@@ -98,11 +110,13 @@ CREATE TABLE audit_logs (
 CREATE INDEX idx_users_email ON users(email);
 CREATE INDEX idx_users_role ON users(role);
 CREATE INDEX idx_users_subscription ON users(subscription);
+CREATE INDEX idx_users_created_at_id ON users(created_at, id); -- keyset pagination
 CREATE INDEX idx_ai_usage_user_id ON ai_usage(user_id);
 CREATE INDEX idx_ai_usage_tool_type ON ai_usage(tool_type);
 CREATE INDEX idx_ai_usage_created_at ON ai_usage(created_at);
 CREATE INDEX idx_refresh_tokens_user_id ON refresh_tokens(user_id);
 CREATE INDEX idx_refresh_tokens_expires_at ON refresh_tokens(expires_at);
+CREATE INDEX idx_refresh_tokens_family_id ON refresh_tokens(family_id);
 CREATE INDEX idx_audit_logs_admin_user_id ON audit_logs(admin_user_id);
 CREATE INDEX idx_audit_logs_created_at ON audit_logs(created_at);
 
@@ -1,12 +1,17 @@
 # Create complete AI SaaS platform project folder structure
 import os
-import shutil
+from emitter import get_emitter
+from tenants import current_tenant
 
-# Create main project directory
-project_name = "ai-saas-platform"
-if os.path.exists(project_name):
-    shutil.rmtree(project_name)
-os.makedirs(project_name)
+# Create main project directory (one folder per tenant in batch mode)
+tenant = current_tenant()
+project_name = tenant.name
+
+# All files go through one shared emitter: writes are atomic, run in parallel
+# and are incremental (only files whose rendered content changed are
+# rewritten). Set clean_build = True to wipe the folder and start over.
+clean_build = False
+emitter = get_emitter(project_name, clean=clean_build)
 
 # Create all subdirectories
 directories = [
@@ -22,11 +27,12 @@ directories = [
     "styles",
     "public",
     "database",
-    "docs"
+    "docs",
+    "benchmarks",
+    "scripts"
 ]
 
-for directory in directories:
-    os.makedirs(os.path.join(project_name, directory), exist_ok=True)
+emitter.make_dirs(directories)
 
 print(f"✅ Created project folder: {project_name}")
 print("📁 Directory structure:")
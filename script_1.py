@@ -1,8 +1,10 @@
 # Add all configuration files to the project root
+from precompress import CONTENT_TYPES, encodings
+from templates import Template
 
 # Package.json
-package_json = """{
-  "name": "ai-saas-platform",
+package_json = Template("""{
+  "name": "[[ package_name ]]",
   "version": "1.0.0",
   "private": true,
   "scripts": {
@@ -10,13 +12,25 @@ package_json = """{
     "build": "next build",
     "start": "next start",
     "lint": "next lint",
-    "type-check": "tsc --noEmit"
+    "type-check": "tsc --noEmit",
+    "bench:mockdb": "tsx benchmarks/mockdb.bench.ts",
+    "bench:db": "tsx benchmarks/db.bench.ts",
+    "bench:auth": "tsx benchmarks/auth.bench.ts",
+    "bench:scheduler": "tsx benchmarks/scheduler.bench.ts",
+[% if streaming %]
+    "bench:stream": "tsx benchmarks/stream.bench.ts",
+[% endif %]
+    "rollups:backfill": "tsx scripts/backfill-rollups.ts"
   },
   "dependencies": {
+[% if supabase %]
     "@supabase/supabase-js": "^2.38.4",
+[% endif %]
     "@types/bcryptjs": "^2.4.6",
+    "@types/better-sqlite3": "^7.6.8",
     "@types/jsonwebtoken": "^9.0.5",
     "bcryptjs": "^2.4.3",
+    "better-sqlite3": "^9.2.2",
     "framer-motion": "^10.16.5",
     "jsonwebtoken": "^9.0.2",
     "next": "14.0.4",
@@ -34,12 +48,17 @@ package_json = """{
     "eslint-config-next": "14.0.4",
     "postcss": "^8.4.32",
     "tailwindcss": "^3.3.6",
+    "tsx": "^4.7.0",
     "typescript": "^5.3.3"
   }
-}"""
+}""", name="package_json", package_name=str, supabase=bool, streaming=bool).render(
+    package_name=tenant.name,
+    supabase=tenant.database == "supabase",
+    streaming=tenant.has_tool("text-generation"),
+)
 
 # Tailwind config
-tailwind_config = """import type { Config } from 'tailwindcss'
+tailwind_config = Template("""import type { Config } from 'tailwindcss'
 
 const config: Config = {
   content: [
@@ -52,16 +71,9 @@ const config: Config = {
     extend: {
       colors: {
         primary: {
-          50: '#eff6ff',
-          100: '#dbeafe',
-          200: '#bfdbfe',
-          300: '#93c5fd',
-          400: '#60a5fa',
-          500: '#3b82f6',
-          600: '#2563eb',
-          700: '#1d4ed8',
-          800: '#1e40af',
-          900: '#1e3a8a',
+[% for shade, color in primary_colors %]
+          [[ shade ]]: '[[ color ]]',
+[% endfor %]
         },
         gray: {
           50: '#f9fafb',
@@ -98,7 +110,9 @@ const config: Config = {
   },
   plugins: [],
 }
-export default config"""
+export default config""", name="tailwind_config", primary_colors=dict).render(
+    primary_colors=tenant.primary_colors,
+)
 
 # TypeScript config
 tsconfig_json = """{
@@ -132,7 +146,26 @@ tsconfig_json = """{
 }"""
 
 # Next.js config
-next_config = """/** @type {import('next').NextConfig} */
+next_config = Template("""[% if precompressed %]
+const IMMUTABLE = 'public, max-age=31536000, immutable'
+// Precompressed copies written by the generator (public/assets/precompressed.json)
+const CONTENT_TYPES = {
+[% for extension, content_type in content_types %]
+  [[ extension ]]: '[[ content_type ]]',
+[% endfor %]
+}
+// [Content-Encoding, file suffix], most preferred first
+const ENCODINGS = [
+[% for encoding, suffix in encodings %]
+  ['[[ encoding ]]', '[[ suffix ]]'],
+[% endfor %]
+]
+const accepts = (encoding) => [
+  { type: 'header', key: 'accept-encoding', value: `(.*)${encoding}(.*)` },
+]
+
+[% endif %]
+/** @type {import('next').NextConfig} */
 const nextConfig = {
   reactStrictMode: true,
   swcMinify: true,
@@ -149,9 +182,46 @@ const nextConfig = {
     OPENAI_API_KEY: process.env.OPENAI_API_KEY,
     STABILITY_API_KEY: process.env.STABILITY_API_KEY,
   },
+[% if precompressed %]
+  async headers() {
+    return Object.entries(CONTENT_TYPES).flatMap(([extension, type]) => [
+      {
+        source: `/assets/:name.${extension}`,
+        headers: [
+          { key: 'Cache-Control', value: IMMUTABLE },
+          { key: 'Content-Type', value: type },
+          { key: 'Vary', value: 'Accept-Encoding' },
+        ],
+      },
+      // Later rules win, so the preferred encoding goes last
+      ...[...ENCODINGS].reverse().map(([encoding]) => ({
+        source: `/assets/:name.${extension}`,
+        has: accepts(encoding),
+        headers: [{ key: 'Content-Encoding', value: encoding }],
+      })),
+    ])
+  },
+  async rewrites() {
+    return {
+      // beforeFiles: the uncompressed file in public/ would match first otherwise
+      beforeFiles: Object.keys(CONTENT_TYPES).flatMap((extension) =>
+        ENCODINGS.map(([encoding, suffix]) => ({
+          source: `/assets/:name.${extension}`,
+          has: accepts(encoding),
+          destination: `/assets/:name.${extension}.${suffix}`,
+        }))
+      ),
+    }
+  },
+[% endif %]
 }
 
-module.exports = nextConfig"""
+module.exports = nextConfig""", name="next_config", precompressed=bool, encodings=list,
+                       content_types=dict).render(
+    precompressed=tenant.precompress,
+    encodings=[(encoding, suffix) for encoding, suffix, _ in encodings()] if tenant.precompress else [],
+    content_types=CONTENT_TYPES,
+)
 
 # PostCSS config
 postcss_config = """module.exports = {
@@ -162,10 +232,10 @@ postcss_config = """module.exports = {
 }"""
 
 # Environment variables
-env_example = """# Authentication
+env_example = Template("""# Authentication
 JWT_SECRET=your-super-secret-jwt-key-here
-JWT_REFRESH_SECRET=your-refresh-token-secret
 
+[% if database == "supabase" %]
 # Database (Choose one)
 # Supabase
 SUPABASE_URL=your-supabase-project-url
@@ -174,6 +244,10 @@ SUPABASE_SERVICE_KEY=your-supabase-service-key
 
 # Or SQLite (for local development)
 DATABASE_URL=file:./dev.db
+[% else %]
+# Database (SQLite)
+DATABASE_URL=file:./dev.db
+[% endif %]
 
 # AI API Keys (Optional - using mock responses if not provided)
 OPENAI_API_KEY=sk-your-openai-api-key
@@ -186,7 +260,9 @@ ADMIN_PASSWORD=secure-admin-password
 
 # App Settings
 NEXTAUTH_URL=http://localhost:3000
-NEXTAUTH_SECRET=your-nextauth-secret"""
+NEXTAUTH_SECRET=your-nextauth-secret""", name="env_example", database=str).render(
+    database=tenant.database,
+)
 
 # Write configuration files
 config_files = {
@@ -198,9 +274,7 @@ config_files = {
     '.env.example': env_example
 }
 
-for filename, content in config_files.items():
-    with open(os.path.join(project_name, filename), 'w') as f:
-        f.write(content)
+emitter.write_files(config_files)
 
 print("✅ Added configuration files:")
 for filename in config_files.keys():
@@ -1,10 +1,14 @@
 # Add all API routes
+from templates import Template
 
 # Login API
 login_api = """// pages/api/auth/login.ts - Login API endpoint
 
 import type { NextApiRequest, NextApiResponse } from 'next';
-import { AuthUtils, MockDB } from '@/lib/auth';
+import { AuthUtils } from '@/lib/auth';
+import { db } from '@/lib/db';
+import { isPasswordPoolBusy, needsRehash } from '@/lib/password';
+import { issueTokens } from '@/lib/refresh-tokens';
 import { LoginCredentials, AuthTokens } from '@/types';
 
 type LoginResponse = {
@@ -38,7 +42,7 @@ export default async function handler(
     }
 
     // Find user by email
-    const user = await MockDB.findUserByEmail(email);
+    const user = await db.findUserByEmail(email);
     if (!user) {
       return res.status(401).json({
         success: false,
@@ -47,7 +51,7 @@ export default async function handler(
     }
 
     // Verify password
-    const passwordHash = await MockDB.getPasswordHash(email);
+    const passwordHash = await db.getPasswordHash(email);
     if (!passwordHash || !(await AuthUtils.verifyPassword(password, passwordHash))) {
       return res.status(401).json({
         success: false,
@@ -55,8 +59,15 @@ export default async function handler(
       });
     }
 
+    // Redo hashes made at another cost; the login does not wait for it
+    if (await needsRehash(passwordHash)) {
+      AuthUtils.hashPassword(password)
+        .then(hash => db.updatePasswordHash(email, hash))
+        .catch(error => console.error('Password rehash failed:', error));
+    }
+
     // Generate tokens
-    const tokens = AuthUtils.generateTokens(user);
+    const tokens = issueTokens(user);
 
     // Remove sensitive information from user object
     const { totalUsage, createdAt, ...safeUser } = user;
@@ -70,6 +81,12 @@ export default async function handler(
     });
 
   } catch (error) {
+    if (isPasswordPoolBusy(error)) {
+      return res.status(503).json({
+        success: false,
+        error: 'Server busy, please try again'
+      });
+    }
     console.error('Login error:', error);
     res.status(500).json({
       success: false,
@@ -82,7 +99,10 @@ export default async function handler(
 register_api = """// pages/api/auth/register.ts - Registration API endpoint
 
 import type { NextApiRequest, NextApiResponse } from 'next';
-import { AuthUtils, MockDB } from '@/lib/auth';
+import { AuthUtils } from '@/lib/auth';
+import { db } from '@/lib/db';
+import { isPasswordPoolBusy } from '@/lib/password';
+import { issueTokens } from '@/lib/refresh-tokens';
 import { RegisterData, AuthTokens } from '@/types';
 
 type RegisterResponse = {
@@ -131,7 +151,7 @@ export default async function handler(
     }
 
     // Check if user already exists
-    const existingUser = await MockDB.findUserByEmail(email);
+    const existingUser = await db.findUserByEmail(email);
     if (existingUser) {
       return res.status(400).json({
         success: false,
@@ -143,7 +163,7 @@ export default async function handler(
     const hashedPassword = await AuthUtils.hashPassword(password);
 
     // Create user
-    const newUser = await MockDB.createUser({
+    const newUser = await db.createUser({
       name,
       email,
       role: 'user',
@@ -152,7 +172,7 @@ export default async function handler(
     });
 
     // Generate tokens
-    const tokens = AuthUtils.generateTokens(newUser);
+    const tokens = issueTokens(newUser);
 
     // Remove sensitive information
     const { totalUsage, createdAt, ...safeUser } = newUser;
@@ -166,6 +186,12 @@ export default async function handler(
     });
 
   } catch (error) {
+    if (isPasswordPoolBusy(error)) {
+      return res.status(503).json({
+        success: false,
+        error: 'Server busy, please try again'
+      });
+    }
     console.error('Registration error:', error);
     res.status(500).json({
       success: false,
@@ -174,11 +200,111 @@ export default async function handler(
   }
 }"""
 
-# Text Generation API
-text_generate_api = """// pages/api/ai/text-generate.ts - Text generation API endpoint
+# Refresh API (single-use refresh tokens, see lib/refresh-tokens.ts)
+refresh_api = """// pages/api/auth/refresh.ts - Exchange a refresh token for a new access and refresh token
 
 import type { NextApiRequest, NextApiResponse } from 'next';
 import { AuthUtils } from '@/lib/auth';
+import { db } from '@/lib/db';
+import { getRefreshTokens } from '@/lib/refresh-tokens';
+import { AuthTokens } from '@/types';
+
+type RefreshResponse = {
+  success: boolean;
+  data?: {
+    tokens: AuthTokens;
+  };
+  error?: string;
+};
+
+export default async function handler(
+  req: NextApiRequest,
+  res: NextApiResponse<RefreshResponse>
+) {
+  if (req.method !== 'POST') {
+    return res.status(405).json({
+      success: false,
+      error: 'Method not allowed'
+    });
+  }
+
+  try {
+    const { refreshToken } = req.body || {};
+    if (!refreshToken || typeof refreshToken !== 'string') {
+      return res.status(400).json({
+        success: false,
+        error: 'Refresh token is required'
+      });
+    }
+
+    // Spends the token; presenting it again revokes every token of this login
+    const result = getRefreshTokens().rotate(refreshToken);
+    if (result.status !== 'rotated') {
+      return res.status(401).json({
+        success: false,
+        error: result.status === 'reused'
+          ? 'Refresh token already used; please log in again'
+          : 'Invalid refresh token'
+      });
+    }
+
+    // Fresh claims: the role or plan may have changed since the last token
+    const user = await db.findUserById(result.userId);
+    if (!user) {
+      return res.status(401).json({
+        success: false,
+        error: 'Invalid refresh token'
+      });
+    }
+
+    res.status(200).json({
+      success: true,
+      data: {
+        tokens: {
+          accessToken: AuthUtils.generateAccessToken(user),
+          refreshToken: result.refreshToken
+        }
+      }
+    });
+
+  } catch (error) {
+    console.error('Refresh error:', error);
+    res.status(500).json({
+      success: false,
+      error: 'Internal server error'
+    });
+  }
+}"""
+
+# Text Generation API
+text_generate_api = Template("""// pages/api/ai/text-generate.ts - Text generation API endpoint
+//
+// With "stream": true in the body (or Accept: text/event-stream) the text is
+// sent as server-sent events while the model produces it:
+//
+//   event: token  data: {"text":"Here's "}     one per token
+//   event: done   data: {"usage":{...},"cached":false,"coalesced":false}
+//                 tokens used and credits left, and where the text came from
+//   event: error  data: {"error":"..."}
+//
+// Otherwise the whole text comes back in one JSON body once generation ends.
+// A prompt answered before with the same maxLength comes from the response
+// cache, free of charge. One that is being generated right now joins that
+// generation (lib/single-flight.ts) and is not charged: the request that
+// started it pays for everything it generates. A generation stops once every
+// client waiting for it has disconnected, so the starter is charged for the
+// tokens produced until then; if others are still waiting, it runs to the end
+// and the starter is charged in full even though it went away. New
+// generations wait for a model slot in the fair scheduler (lib/scheduler.ts);
+// when the caller's tier is over its queue bound the answer is 503.
+
+import type { NextApiRequest, NextApiResponse } from 'next';
+import { accessToken, authenticate } from '@/lib/session';
+import { CreditHold, getCredits } from '@/lib/credits';
+import { cacheKey, getResponseCache } from '@/lib/response-cache';
+import { getModelScheduler, isModelQueueBusy } from '@/lib/scheduler';
+import { getGenerationFlights } from '@/lib/single-flight';
+import { getUsageLedger } from '@/lib/usage';
 import { AIResponse } from '@/types';
 
 // Mock AI responses for demonstration
@@ -188,6 +314,63 @@ const mockTextResponses = [
   "This is an example of AI-generated text that showcases natural language processing capabilities. The content is coherent, contextually relevant, and maintains a professional tone throughout the response."
 ];
 
+// Time the mock model takes to produce a whole response
+const GENERATION_MS = [[ delay_ms ]];
+// Part of the cache key: another model must not be served this one's answers
+const MODEL = 'mock-text-1';
+
+// no-transform keeps Next.js's gzip from buffering the events
+const SSE_HEADERS = {
+  'Content-Type': 'text/event-stream; charset=utf-8',
+  'Cache-Control': 'no-cache, no-transform',
+  'Connection': 'keep-alive',
+  'X-Accel-Buffering': 'no' // nginx: pass each event through as it is written
+};
+
+// Mock model: emits `text` a word at a time, spread over GENERATION_MS.
+// Resolves with what was emitted, which is less than `text` if `signal` aborts.
+function generate(text: string, onToken: (token: string) => void, signal: AbortSignal): Promise<string> {
+  const tokens = text.match(/\\S+\\s*/g) || [];
+  const interval = GENERATION_MS / Math.max(1, tokens.length);
+  return new Promise(resolve => {
+    let produced = '';
+    let next = 0;
+    let timer: ReturnType<typeof setTimeout> | null = null;
+    const stop = () => {
+      if (timer) clearTimeout(timer);
+      resolve(produced);
+    };
+    const step = () => {
+      const token = tokens[next++];
+      produced += token;
+      onToken(token);
+      if (next < tokens.length) {
+        timer = setTimeout(step, interval);
+      } else {
+        signal.removeEventListener('abort', stop);
+        resolve(produced);
+      }
+    };
+    if (signal.aborted || !tokens.length) {
+      return resolve('');
+    }
+    signal.addEventListener('abort', stop);
+    timer = setTimeout(step, interval);
+  });
+}
+
+// Select a random mock response, truncated to maxLength
+function mockResponse(maxLength: number): string {
+  const randomResponse = mockTextResponses[Math.floor(Math.random() * mockTextResponses.length)];
+  return randomResponse.length > maxLength 
+    ? randomResponse.substring(0, maxLength) + '...'
+    : randomResponse;
+}
+
+function sendEvent(res: NextApiResponse, event: string, data: unknown): void {
+  res.write(`event: ${event}\\ndata: ${JSON.stringify(data)}\\n\\n`);
+}
+
 export default async function handler(
   req: NextApiRequest,
   res: NextApiResponse<AIResponse>
@@ -199,18 +382,19 @@ export default async function handler(
     });
   }
 
+  let hold: CreditHold | null = null;
   try {
-    // Verify authentication
-    const token = AuthUtils.extractTokenFromHeader(req.headers.authorization);
-    if (!token) {
+    // Verify authentication (the dashboard sends the session cookie, like the middleware accepts)
+    const decoded = authenticate(accessToken(req.headers.authorization, req.cookies.accessToken));
+    if (!decoded) {
       return res.status(401).json({
         success: false,
         error: 'Authentication required'
       });
     }
 
-    const decoded = AuthUtils.verifyAccessToken(token);
     const { prompt, maxLength = 150 } = req.body;
+    const stream = req.body.stream === true || (req.headers.accept || '').indexOf('text/event-stream') !== -1;
 
     if (!prompt) {
       return res.status(400).json({
@@ -219,58 +403,165 @@ export default async function handler(
       });
     }
 
-    // Simulate processing delay
-    await new Promise(resolve => setTimeout(resolve, 2000));
+    if (typeof maxLength !== 'number' || !(maxLength > 0)) {
+      return res.status(400).json({
+        success: false,
+        error: 'maxLength must be a positive number'
+      });
+    }
 
-    // Select a random mock response
-    const randomResponse = mockTextResponses[Math.floor(Math.random() * mockTextResponses.length)];
-    
-    // Truncate response based on maxLength
-    const truncatedResponse = randomResponse.length > maxLength 
-      ? randomResponse.substring(0, maxLength) + '...'
-      : randomResponse;
+    // A repeated request is answered from the cache: no model call, no charge
+    const cache = getResponseCache();
+    const key = cacheKey('text-generation', MODEL, prompt, { maxLength });
+    const cached = await cache.get<string>(key);
+
+    // Only the request that starts a generation pays for it, in full
+    const flights = getGenerationFlights();
+    if (cached === null && !flights.has(key)) {
+      // Reserve the most this request can cost before calling the model
+      hold = getCredits().reserve(decoded.userId, decoded.subscription, Math.ceil(maxLength / 4));
+      if (!hold) {
+        return res.status(402).json({
+          success: false,
+          error: 'Monthly credit limit reached',
+          usage: { tokensUsed: 0, remainingCredits: 0 }
+        });
+      }
+    }
 
-    // Simulate usage tracking
-    const tokensUsed = Math.floor(truncatedResponse.length / 4);
-    const remainingCredits = decoded.subscription === 'Enterprise' ? -1 : Math.max(0, 1000 - tokensUsed);
+    if (stream) {
+      res.writeHead(200, SSE_HEADERS);
+      res.flushHeaders();
+    }
+
+    const startedAt = Date.now();
+    let text = '';
+    let generated = '';
+    let cancelled = false;
+    let coalesced = false;
+    if (cached !== null) {
+      text = cached;
+      if (stream) {
+        sendEvent(res, 'token', { text });
+      }
+    } else {
+      // Join the generation already running for this request, or start it
+      const { flight, leader } = flights.join<string>(key, async current => {
+        // Queued under the tier of the request that started the generation
+        const generated = await getModelScheduler('text-generation').run(
+          { userId: decoded.userId, plan: decoded.subscription },
+          () => generate(mockResponse(maxLength), token => current.emit(token), current.signal),
+          current.signal
+        );
+        if (!current.signal.aborted) {
+          await cache.set(key, generated);
+        }
+        return generated;
+      });
+      coalesced = !leader;
+      const detach = flight.attach(token => {
+        text += token;
+        if (stream) {
+          sendEvent(res, 'token', { text: token });
+        }
+      });
+
+      // A closed connection before the response ended means the client went away;
+      // the generation stops once no caller is left
+      const disconnected = new Promise<void>(resolve => res.on('close', () => {
+        if (!res.writableEnded) {
+          cancelled = true;
+          resolve();
+        }
+      }));
+      try {
+        await Promise.race([flight.result, disconnected]);
+      } finally {
+        detach();
+      }
+      // The starter is billed for the whole generation, which may outlive its
+      // connection while joined clients keep receiving it
+      generated = leader ? await flight.result.catch(() => text) : text;
+    }
+
+    // Usage is buffered and written to ai_usage in batches, off the response path
+    const tokensUsed = hold ? Math.floor(generated.length / 4) : 0;
+    await getUsageLedger().record({
+      userId: decoded.userId,
+      toolType: 'text-generation',
+      tokensUsed,
+      processingTimeMs: Date.now() - startedAt,
+      success: !cancelled,
+      errorMessage: cancelled ? 'Client disconnected' : undefined,
+      metadata: { maxLength, stream, cached: cached !== null, coalesced }
+    });
+    const remainingCredits = hold
+      ? hold.settle(tokensUsed)
+      : getCredits().balance(decoded.userId, decoded.subscription);
+    const usage = { tokensUsed, remainingCredits };
+
+    if (cancelled) {
+      return;
+    }
+    if (stream) {
+      sendEvent(res, 'done', { usage, cached: cached !== null, coalesced });
+      return res.end();
+    }
 
     res.status(200).json({
       success: true,
       data: {
-        text: truncatedResponse,
-        prompt: prompt
+        text,
+        prompt: prompt,
+        cached: cached !== null,
+        coalesced
       },
-      usage: {
-        tokensUsed,
-        remainingCredits
-      }
+      usage
     });
 
   } catch (error) {
+    hold?.cancel(); // no-op once settled
+    if (isModelQueueBusy(error)) {
+      if (res.headersSent) {
+        sendEvent(res, 'error', { error: 'Server busy, please try again' });
+        return res.end();
+      }
+      res.setHeader('Retry-After', '1');
+      return res.status(503).json({
+        success: false,
+        error: 'Server busy, please try again'
+      });
+    }
     console.error('Text generation error:', error);
+    if (res.headersSent) {
+      // Mid-stream: the status line is gone, so report the failure as an event
+      sendEvent(res, 'error', { error: 'Internal server error' });
+      return res.end();
+    }
     res.status(500).json({
       success: false,
       error: 'Internal server error'
     });
   }
-}"""
+}""", name="text_generate_api", delay_ms=int).render(
+    delay_ms=2000,
+)
 
-# Image Generation API
+# Image Generation API (queues a job; see lib/image-jobs.ts)
 image_generate_api = """// pages/api/ai/image-generate.ts - Image generation API endpoint
+//
+// Image generation takes seconds, so the request only queues a job: the
+// response is 202 with the job id, and GET /api/ai/image-jobs/[id] (see the
+// Location header) reports the images once a worker has produced them.
 
 import type { NextApiRequest, NextApiResponse } from 'next';
-import { AuthUtils } from '@/lib/auth';
+import { accessToken, authenticate } from '@/lib/session';
+import { getCredits } from '@/lib/credits';
+import { GeneratedImage, getImageJobs, imageCacheKey, imageJobView } from '@/lib/image-jobs';
+import { getResponseCache } from '@/lib/response-cache';
+import { getUsageLedger } from '@/lib/usage';
 import { AIResponse } from '@/types';
 
-// Mock image URLs for demonstration
-const mockImageUrls = [
-  'https://images.unsplash.com/photo-1547036967-23d11aacaee0?w=512&h=512&fit=crop',
-  'https://images.unsplash.com/photo-1518837695005-2083093ee35b?w=512&h=512&fit=crop',
-  'https://images.unsplash.com/photo-1501594907352-04cda38ebc29?w=512&h=512&fit=crop',
-  'https://images.unsplash.com/photo-1506905925346-21bda4d32df4?w=512&h=512&fit=crop',
-  'https://images.unsplash.com/photo-1519904981063-b0cf448d479e?w=512&h=512&fit=crop'
-];
-
 export default async function handler(
   req: NextApiRequest,
   res: NextApiResponse<AIResponse>
@@ -284,15 +575,14 @@ export default async function handler(
 
   try {
     // Verify authentication
-    const token = AuthUtils.extractTokenFromHeader(req.headers.authorization);
-    if (!token) {
+    const decoded = authenticate(accessToken(req.headers.authorization));
+    if (!decoded) {
       return res.status(401).json({
         success: false,
         error: 'Authentication required'
       });
     }
 
-    const decoded = AuthUtils.verifyAccessToken(token);
     const { prompt, style = 'realistic', size = '512x512' } = req.body;
 
     if (!prompt) {
@@ -302,36 +592,50 @@ export default async function handler(
       });
     }
 
-    // Simulate processing delay (image generation typically takes longer)
-    await new Promise(resolve => setTimeout(resolve, 4000));
-
-    // Select random mock images
-    const numberOfImages = Math.min(4, Math.floor(Math.random() * 3) + 1);
-    const selectedImages = mockImageUrls
-      .sort(() => 0.5 - Math.random())
-      .slice(0, numberOfImages)
-      .map((url, index) => ({
-        id: `img_${Date.now()}_${index}`,
-        url,
-        prompt: prompt,
-        style: style,
-        size: size
-      }));
+    const request = { prompt, style, size, plan: decoded.subscription };
+    const jobs = getImageJobs();
+
+    // A repeated request is answered from the cache: the job is stored as
+    // already finished, with no model call and no charge
+    const cached = await getResponseCache().get<GeneratedImage[]>(imageCacheKey(request));
+    if (cached !== null) {
+      const job = imageJobView(jobs.submit(decoded.userId, request, cached));
+      await getUsageLedger().record({
+        userId: decoded.userId,
+        toolType: 'image-generation',
+        tokensUsed: 0,
+        processingTimeMs: 0,
+        success: true,
+        metadata: { style, size, images: cached.length, cached: true, coalesced: false, jobId: job.jobId }
+      });
+      res.setHeader('Location', job.statusUrl);
+      return res.status(200).json({
+        success: true,
+        data: { ...job, cached: true },
+        usage: {
+          tokensUsed: 0,
+          remainingCredits: getCredits().balance(decoded.userId, decoded.subscription)
+        }
+      });
+    }
 
-    // Simulate usage tracking
-    const tokensUsed = numberOfImages * 100; // 100 tokens per image
-    const remainingCredits = decoded.subscription === 'Enterprise' ? -1 : Math.max(0, 1000 - tokensUsed);
+    // Credits are reserved when the job runs; turn the request away now if there are none left
+    const remainingCredits = getCredits().balance(decoded.userId, decoded.subscription);
+    if (remainingCredits === 0) {
+      return res.status(402).json({
+        success: false,
+        error: 'Monthly credit limit reached',
+        usage: { tokensUsed: 0, remainingCredits: 0 }
+      });
+    }
 
-    res.status(200).json({
+    const job = imageJobView(jobs.submit(decoded.userId, request));
+    res.setHeader('Location', job.statusUrl);
+    res.status(202).json({
       success: true,
-      data: {
-        images: selectedImages,
-        prompt: prompt,
-        style: style,
-        size: size
-      },
+      data: job,
       usage: {
-        tokensUsed,
+        tokensUsed: 0,
         remainingCredits
       }
     });
@@ -345,11 +649,116 @@ export default async function handler(
   }
 }"""
 
+# Status of a queued image job: polled, or one server-sent event when it finishes
+image_job_api = """// pages/api/ai/image-jobs/[id].ts - Status and result of an image generation job
+//
+// A plain GET returns the job; while it is queued or running, Retry-After
+// says when to ask again. With Accept: text/event-stream (what EventSource
+// sends) the response is a stream instead: a `status` event at once, then a
+// `done` event with the finished job, and the stream ends.
+
+import type { NextApiRequest, NextApiResponse } from 'next';
+import { accessToken, authenticate } from '@/lib/session';
+import { getImageJobs, imageJobView } from '@/lib/image-jobs';
+import { AIResponse } from '@/types';
+
+const SSE_HEADERS = {
+  'Content-Type': 'text/event-stream; charset=utf-8',
+  'Cache-Control': 'no-cache, no-transform',
+  'Connection': 'keep-alive',
+  'X-Accel-Buffering': 'no' // nginx: pass each event through as it is written
+};
+// A comment line now and then keeps proxies from closing an idle stream
+const HEARTBEAT_MS = 15_000;
+const RETRY_AFTER_S = 1;
+
+function sendEvent(res: NextApiResponse, event: string, data: unknown): void {
+  res.write(`event: ${event}\\ndata: ${JSON.stringify(data)}\\n\\n`);
+}
+
+export default async function handler(
+  req: NextApiRequest,
+  res: NextApiResponse<AIResponse>
+) {
+  if (req.method !== 'GET') {
+    return res.status(405).json({
+      success: false,
+      error: 'Method not allowed'
+    });
+  }
+
+  try {
+    // EventSource cannot set headers, so the session cookie is accepted too
+    const decoded = authenticate(accessToken(req.headers.authorization, req.cookies.accessToken));
+    if (!decoded) {
+      return res.status(401).json({
+        success: false,
+        error: 'Authentication required'
+      });
+    }
+
+    const jobs = getImageJobs();
+    const job = jobs.get(String(req.query.id));
+    // Someone else's job is reported as missing, not forbidden
+    if (!job || (job.userId !== decoded.userId && decoded.role !== 'admin')) {
+      return res.status(404).json({
+        success: false,
+        error: 'Job not found'
+      });
+    }
+    const finished = job.status === 'succeeded' || job.status === 'failed';
+
+    if ((req.headers.accept || '').indexOf('text/event-stream') === -1) {
+      if (!finished) {
+        res.setHeader('Retry-After', String(RETRY_AFTER_S));
+      }
+      return res.status(200).json({
+        success: true,
+        data: imageJobView(job)
+      });
+    }
+
+    res.writeHead(200, SSE_HEADERS);
+    res.flushHeaders();
+    if (finished) {
+      sendEvent(res, 'done', imageJobView(job));
+      return res.end();
+    }
+    sendEvent(res, 'status', imageJobView(job));
+
+    const closed = new AbortController();
+    res.on('close', () => closed.abort());
+    const heartbeat = setInterval(() => res.write(': keep-alive\\n\\n'), HEARTBEAT_MS);
+    try {
+      const done = await jobs.wait(job.id, closed.signal);
+      if (done) {
+        sendEvent(res, 'done', imageJobView(done));
+      }
+    } finally {
+      clearInterval(heartbeat);
+    }
+    res.end();
+
+  } catch (error) {
+    console.error('Image job status error:', error);
+    if (res.headersSent) {
+      sendEvent(res, 'error', { error: 'Internal server error' });
+      return res.end();
+    }
+    res.status(500).json({
+      success: false,
+      error: 'Internal server error'
+    });
+  }
+}"""
+
 # Admin users API
 admin_users_api = """// pages/api/admin/users.ts - Admin user management API
 
 import type { NextApiRequest, NextApiResponse } from 'next';
-import { AuthUtils, MockDB } from '@/lib/auth';
+import { accessToken, authenticate } from '@/lib/session';
+import { db } from '@/lib/db';
+import { MAX_PAGE_SIZE, decodeCursor } from '@/lib/pagination';
 import { User } from '@/types';
 
 type UsersResponse = {
@@ -358,9 +767,9 @@ type UsersResponse = {
     users: User[];
     pagination: {
       total: number;
-      page: number;
       limit: number;
-      totalPages: number;
+      // Pass back as ?cursor= for the next page; null on the last page
+      nextCursor: string | null;
     };
   };
   error?: string;
@@ -372,15 +781,14 @@ export default async function handler(
 ) {
   try {
     // Verify admin authentication
-    const token = AuthUtils.extractTokenFromHeader(req.headers.authorization);
-    if (!token) {
+    const decoded = authenticate(accessToken(req.headers.authorization));
+    if (!decoded) {
       return res.status(401).json({
         success: false,
         error: 'Authentication required'
       });
     }
 
-    const decoded = AuthUtils.verifyAccessToken(token);
     if (decoded.role !== 'admin') {
       return res.status(403).json({
         success: false,
@@ -389,35 +797,28 @@ export default async function handler(
     }
 
     if (req.method === 'GET') {
-      // Get all users with pagination
-      const page = parseInt(req.query.page as string) || 1;
-      const limit = parseInt(req.query.limit as string) || 10;
+      // Keyset pagination ordered by (createdAt, id); search matches word prefixes
+      const limit = Math.min(Math.max(parseInt(req.query.limit as string) || 10, 1), MAX_PAGE_SIZE);
+      const cursor = req.query.cursor as string || null;
       const search = req.query.search as string || '';
 
-      const allUsers = await MockDB.getAllUsers();
-      
-      // Filter users based on search
-      const filteredUsers = search 
-        ? allUsers.filter(user => 
-            user.name.toLowerCase().includes(search.toLowerCase()) ||
-            user.email.toLowerCase().includes(search.toLowerCase())
-          )
-        : allUsers;
-
-      // Paginate results
-      const startIndex = (page - 1) * limit;
-      const endIndex = startIndex + limit;
-      const paginatedUsers = filteredUsers.slice(startIndex, endIndex);
+      if (cursor && !decodeCursor(cursor)) {
+        return res.status(400).json({
+          success: false,
+          error: 'Invalid cursor'
+        });
+      }
+
+      const { users, total, nextCursor } = await db.listUsers({ limit, cursor, search });
 
       return res.status(200).json({
         success: true,
         data: {
-          users: paginatedUsers,
+          users,
           pagination: {
-            total: filteredUsers.length,
-            page,
+            total,
             limit,
-            totalPages: Math.ceil(filteredUsers.length / limit)
+            nextCursor
           }
         }
       });
@@ -442,28 +843,20 @@ export default async function handler(
 admin_analytics_api = """// pages/api/admin/analytics.ts - Admin analytics API
 
 import type { NextApiRequest, NextApiResponse } from 'next';
-import { AuthUtils } from '@/lib/auth';
-import { AdminStats } from '@/types';
+import { accessToken, authenticate } from '@/lib/session';
+import { UsageInterval, getAdminStats, getUsageSeries } from '@/lib/analytics';
+import { AdminStats, UsagePoint } from '@/types';
 
 type AnalyticsResponse = {
   success: boolean;
-  data?: AdminStats;
+  data?: AdminStats & { usageSeries?: UsagePoint[] };
   error?: string;
 };
 
-// Mock analytics data
-const mockAnalytics: AdminStats = {
-  totalUsers: 1247,
-  activeUsers: 892,
-  totalAPIUsage: 45678,
-  revenueThisMonth: 12450,
-  userGrowth: 23.5,
-  usageByTool: {
-    'text-generation': 18500,
-    'image-generation': 12300,
-    'code-generation': 8900,
-    'summarization': 5978
-  }
+// How far back ?interval=hour|day reaches
+const SERIES_WINDOW_MS: Record<UsageInterval, number> = {
+  hour: 48 * 60 * 60 * 1000,
+  day: 30 * 24 * 60 * 60 * 1000
 };
 
 export default async function handler(
@@ -479,15 +872,14 @@ export default async function handler(
 
   try {
     // Verify admin authentication
-    const token = AuthUtils.extractTokenFromHeader(req.headers.authorization);
-    if (!token) {
+    const decoded = authenticate(accessToken(req.headers.authorization));
+    if (!decoded) {
       return res.status(401).json({
         success: false,
         error: 'Authentication required'
       });
     }
 
-    const decoded = AuthUtils.verifyAccessToken(token);
     if (decoded.role !== 'admin') {
       return res.status(403).json({
         success: false,
@@ -495,9 +887,23 @@ export default async function handler(
       });
     }
 
+    const { interval } = req.query;
+    if (interval !== undefined && interval !== 'hour' && interval !== 'day') {
+      return res.status(400).json({
+        success: false,
+        error: 'interval must be hour or day'
+      });
+    }
+
+    // Read from the rollup tables, not ai_usage: constant work per request
+    const stats = await getAdminStats();
+    const data = interval
+      ? { ...stats, usageSeries: await getUsageSeries(interval, new Date(Date.now() - SERIES_WINDOW_MS[interval])) }
+      : stats;
+
     res.status(200).json({
       success: true,
-      data: mockAnalytics
+      data
     });
 
   } catch (error) {
@@ -509,20 +915,101 @@ export default async function handler(
   }
 }"""
 
-# Write all API files
+# Admin metrics API (per-process counters)
+admin_metrics_api = """// pages/api/admin/metrics.ts - Cache, buffer, worker pool, queue and token counters of this server process
+
+import type { NextApiRequest, NextApiResponse } from 'next';
+import { accessToken, authenticate, tokenCacheStats } from '@/lib/session';
+import { TokenCacheStats } from '@/lib/access-token';
+import { JobQueueStats, jobQueueStats } from '@/lib/jobs';
+import { PasswordPoolStats, passwordPoolStats } from '@/lib/password';
+import { RefreshTokens, getRefreshTokens } from '@/lib/refresh-tokens';
+import { ResponseCacheStats, getResponseCache } from '@/lib/response-cache';
+import { SchedulerStats, modelSchedulerStats } from '@/lib/scheduler';
+import { SingleFlightStats, getGenerationFlights } from '@/lib/single-flight';
+import { UsageLedger, getUsageLedger } from '@/lib/usage';
+
+type MetricsResponse = {
+  success: boolean;
+  data?: {
+    // The middleware runs in its own runtime with its own token cache
+    tokenCache: TokenCacheStats & { hitRate: number };
+    usageLedger: UsageLedger['stats'] & { buffered: number };
+    passwordPool: PasswordPoolStats;
+    refreshTokens: RefreshTokens['stats'];
+    responseCache: ResponseCacheStats;
+    generationFlights: SingleFlightStats;
+    // By tool; a queue shows up once this process has started its workers
+    jobQueues: Record<string, JobQueueStats>;
+    // By tool, once a model call has gone through it
+    modelSchedulers: Record<string, SchedulerStats>;
+  };
+  error?: string;
+};
+
+export default async function handler(
+  req: NextApiRequest,
+  res: NextApiResponse<MetricsResponse>
+) {
+  if (req.method !== 'GET') {
+    return res.status(405).json({
+      success: false,
+      error: 'Method not allowed'
+    });
+  }
+
+  const decoded = authenticate(accessToken(req.headers.authorization));
+  if (!decoded) {
+    return res.status(401).json({
+      success: false,
+      error: 'Authentication required'
+    });
+  }
+
+  if (decoded.role !== 'admin') {
+    return res.status(403).json({
+      success: false,
+      error: 'Admin access required'
+    });
+  }
+
+  const tokenCache = tokenCacheStats();
+  const lookups = tokenCache.hits + tokenCache.misses;
+  const ledger = getUsageLedger();
+  res.status(200).json({
+    success: true,
+    data: {
+      tokenCache: { ...tokenCache, hitRate: lookups ? tokenCache.hits / lookups : 0 },
+      usageLedger: { ...ledger.stats, buffered: ledger.buffered },
+      passwordPool: passwordPoolStats(),
+      refreshTokens: { ...getRefreshTokens().stats },
+      responseCache: getResponseCache().stats(),
+      generationFlights: getGenerationFlights().stats(),
+      jobQueues: jobQueueStats(),
+      modelSchedulers: modelSchedulerStats()
+    }
+  });
+}"""
+
+# Write all API files (AI tool routes only for the tools the tenant enabled)
 api_files = {
     'pages/api/auth/login.ts': login_api,
     'pages/api/auth/register.ts': register_api,
+    'pages/api/auth/refresh.ts': refresh_api,
     'pages/api/ai/text-generate.ts': text_generate_api,
     'pages/api/ai/image-generate.ts': image_generate_api,
+    'pages/api/ai/image-jobs/[id].ts': image_job_api,
     'pages/api/admin/users.ts': admin_users_api,
-    'pages/api/admin/analytics.ts': admin_analytics_api
+    'pages/api/admin/analytics.ts': admin_analytics_api,
+    'pages/api/admin/metrics.ts': admin_metrics_api
 }
+if not tenant.has_tool('text-generation'):
+    del api_files['pages/api/ai/text-generate.ts']
+if not tenant.has_tool('image-generation'):
+    del api_files['pages/api/ai/image-generate.ts']
+    del api_files['pages/api/ai/image-jobs/[id].ts']
 
-for filepath, content in api_files.items():
-    full_path = os.path.join(project_name, filepath)
-    with open(full_path, 'w') as f:
-        f.write(content)
+emitter.write_files(api_files)
 
 print("✅ Added API routes:")
 for filepath in api_files.keys():
@@ -1,4 +1,7 @@
 # Add database schema and documentation
+from precompress import asset_url
+from sqlite_schema import to_sqlite
+from templates import Template
 
 # Database schema
 database_schema = """-- Database schema for AI SaaS Platform
@@ -49,6 +52,16 @@ CREATE TABLE user_settings (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Monthly credit balances; credits_used includes credits leased to app servers
+CREATE TABLE credit_balances (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    period VARCHAR(7) NOT NULL, -- 'YYYY-MM'
+    credits_limit INTEGER NOT NULL, -- -1 for unlimited
+    credits_used INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, period)
+);
+
 -- API keys and integrations (for admin)
 CREATE TABLE api_configurations (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
@@ -74,14 +87,16 @@ CREATE TABLE subscriptions (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Refresh tokens for JWT authentication
+-- Refresh tokens for JWT authentication (rotated on every use, see lib/refresh-tokens.ts)
 CREATE TABLE refresh_tokens (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
     user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    token_hash VARCHAR(255) NOT NULL,
+    family_id UUID NOT NULL, -- every token rotated from the same login
+    token_hash VARCHAR(255) NOT NULL UNIQUE, -- sha256 of the token; the token itself is never stored
     expires_at TIMESTAMP NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    last_used TIMESTAMP
+    last_used TIMESTAMP, -- when it was exchanged for its successor
+    revoked_at TIMESTAMP
 );
 
 -- Audit logs for admin activities
@@ -101,11 +116,13 @@ CREATE TABLE audit_logs (
 CREATE INDEX idx_users_email ON users(email);
 CREATE INDEX idx_users_role ON users(role);
 CREATE INDEX idx_users_subscription ON users(subscription);
+CREATE INDEX idx_users_created_at_id ON users(created_at, id); -- keyset pagination
 CREATE INDEX idx_ai_usage_user_id ON ai_usage(user_id);
 CREATE INDEX idx_ai_usage_tool_type ON ai_usage(tool_type);
 CREATE INDEX idx_ai_usage_created_at ON ai_usage(created_at);
 CREATE INDEX idx_refresh_tokens_user_id ON refresh_tokens(user_id);
 CREATE INDEX idx_refresh_tokens_expires_at ON refresh_tokens(expires_at);
+CREATE INDEX idx_refresh_tokens_family_id ON refresh_tokens(family_id);
 CREATE INDEX idx_audit_logs_admin_user_id ON audit_logs(admin_user_id);
 CREATE INDEX idx_audit_logs_created_at ON audit_logs(created_at);
 
@@ -155,7 +172,8 @@ A complete, production-ready AI SaaS platform similar to Sintra.ai, built with N
 
 ### Backend
 - **API Routes**: RESTful endpoints for auth, AI tools, admin functions
-- **JWT Authentication**: Secure token-based authentication with refresh tokens
+- **JWT Authentication**: Secure token-based authentication with single-use refresh tokens (rotated on every refresh; replaying a used one revokes the whole login); verified tokens are cached until they expire, and the middleware can verify with Web Crypto to run on the edge runtime (`npm run bench:auth` compares the two)
+- **Password Hashing**: bcrypt runs on a bounded worker-thread pool; the cost is calibrated to `PASSWORD_HASH_TARGET_MS` (default 250 ms) at startup and older hashes are upgraded on login
 - **Role-Based Access Control**: User and admin permissions
 - **AI Integration**: Multiple AI services with usage tracking
 - **Database Integration**: Support for Supabase, Firebase, or SQLite
@@ -212,7 +230,6 @@ Edit `.env.local` with your configuration:
 ```env
 # Authentication
 JWT_SECRET=your-super-secret-jwt-key-here
-JWT_REFRESH_SECRET=your-refresh-token-secret
 
 # Database - Supabase (Recommended)
 SUPABASE_URL=your-supabase-project-url
@@ -248,7 +265,21 @@ Open [http://localhost:3000](http://localhost:3000) in your browser.
 
 ### Option 2: SQLite (Local Development)
 
-For local development, the app can use SQLite with the same schema. The database file will be created automatically at `./dev.db`.
+For local development, set `DATABASE_URL=file:./dev.db` and the API routes use SQLite instead of the in-memory mock store. The database file is created automatically and `database/schema.sqlite.sql` (the SQLite variant of `database/schema.sql`) is applied on startup. Connections run in WAL mode and reuse their prepared statements; `npm run bench:db` compares the throughput with the mock store.
+
+Admin analytics are served from rollup tables (hourly and daily usage per tool and plan, signups, plan totals, tokens per user) that triggers keep current as rows land. `npm run rollups:backfill` rebuilds them from `ai_usage` and `users`.
+
+The AI routes record usage through a buffered ledger (`lib/usage.ts`): rows are written to `ai_usage` in batched transactions every second or every 500 rows, callers wait only when 10,000 rows are already pending, and anything buffered is flushed on shutdown. Rows carry the time they were recorded, not written. While the database is unavailable (busy, locked, I/O errors) batches stay buffered and are retried with backoff; only a batch rejected for other reasons is retried row by row, dropping just the failing rows (`usageLedger.dropped` in the admin metrics).
+
+Monthly credits are enforced before every model call (`lib/credits.ts`). Each user's allowance comes from `user_settings.api_limit_per_month`, else their plan; `credit_balances` holds the month's balance. Server processes lease credits from it in chunks of 10% of the allowance and spend them from an in-memory bucket, so the check costs no database read and several processes together never exceed the allowance. Requests over the limit get `402`.
+
+Repeated generation requests (same tool, prompt and options) are answered from an exact-match response cache (`lib/response-cache.ts`) without calling the model or charging credits. Entries expire after `RESPONSE_CACHE_TTL_MS` (1 hour) and the least recently used are evicted beyond `RESPONSE_CACHE_MAX_BYTES` (64 MB). `RESPONSE_CACHE=sqlite` shares the cache between server processes through the SQLite database; `RESPONSE_CACHE=off` disables it.
+
+Identical requests that arrive while the same generation is still running join it instead of starting another (`lib/single-flight.ts`): they all receive its result, or its stream from the first token, and only the request that started it is charged, for the whole generation: if it disconnects while others are still waiting, the generation runs to the end and it pays in full. Each request still gets its own `ai_usage` row (`metadata.coalesced`), and the generation is only cancelled once every client waiting for it has disconnected.
+
+Image generation runs as a job (`lib/jobs.ts`, `lib/image-jobs.ts`): `POST /api/ai/image-generate` queues it and answers `202` with the job id, and each server process runs `IMAGE_JOB_CONCURRENCY` (4) workers that take queued jobs oldest first. Credits are reserved when a job starts. With SQLite the jobs are stored in `generation_jobs` and survive restarts: a running job is leased for 30 seconds and renewed while it runs, a job whose server went away is picked up again (at most 3 runs), and finished jobs are kept for a day.
+
+Model calls are scheduled by subscription tier (`lib/scheduler.ts`). Each server process runs at most `MODEL_CONCURRENCY` (16) calls per tool at once. Further calls wait in a queue per tier: while several tiers are waiting, free slots go to Enterprise, Professional and Starter in a 6:3:1 ratio, and within a tier users take turns, so one user's burst cannot hold up others. Each tier bounds its queue, each user's share of it and the wait (5, 10 and 20 seconds), beyond which the text route answers `503` and an image job fails. `npm run bench:scheduler` compares the per-tier p50 / p99 queue wait with a first-come-first-served queue under mixed load.
 
 ## 🚀 Deployment
 
@@ -320,16 +351,19 @@ npm run build
 
 - `POST /api/auth/login` - User login
 - `POST /api/auth/register` - User registration  
+- `POST /api/auth/refresh` - Exchange a refresh token for new tokens (single use)
 
 ### AI Tool Endpoints
 
-- `POST /api/ai/text-generate` - Text generation
-- `POST /api/ai/image-generate` - Image creation
+- `POST /api/ai/text-generate` - Text generation; with `"stream": true` the tokens arrive as server-sent events as they are produced, with the usage totals and the `cached` / `coalesced` flags in a final `done` event (`npm run bench:stream` compares time to first token with the blocking response)
+- `POST /api/ai/image-generate` - Image creation; queues a job and answers `202` with its `jobId` (a repeated request is answered at once from the cache)
+- `GET /api/ai/image-jobs/:id` - Status and images of an image job; poll it (`Retry-After` while it runs) or open it with `Accept: text/event-stream` for a `done` event when it finishes
 
 ### Admin Endpoints
 
-- `GET /api/admin/users` - List all users
-- `GET /api/admin/analytics` - Platform analytics
+- `GET /api/admin/users` - List users (`?limit=&search=`, then `&cursor=` with the returned `nextCursor`)
+- `GET /api/admin/analytics` - Platform analytics (`?interval=hour|day` adds a usage series)
+- `GET /api/admin/metrics` - Token cache hit/miss counters, usage ledger state, password worker pool queue depth, refresh-token rotation, response cache hit/miss/eviction counters, the request coalescing rate, job queue depth and wait/run latency, and the model scheduler's per-tier queue wait and rejections of the serving process
 
 ## 🔑 Default Login Credentials
 
@@ -461,8 +495,31 @@ body {
   @apply text-primary-500 dark:text-primary-400;
 }"""
 
+# Landing page icon; only linked (as its hashed, precompressed copy) when the tenant precompresses assets
+favicon_svg = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 64 64">
+  <defs>
+    <linearGradient id="bg" x1="0" y1="0" x2="1" y2="1">
+      <stop offset="0" stop-color="#3b82f6"/>
+      <stop offset="1" stop-color="#4f46e5"/>
+    </linearGradient>
+  </defs>
+  <rect width="64" height="64" rx="14" fill="url(#bg)"/>
+  <line x1="32" y1="8" x2="32" y2="16" stroke="#ffffff" stroke-width="3" stroke-linecap="round"/>
+  <circle cx="32" cy="7" r="3" fill="#ffffff"/>
+  <rect x="12" y="16" width="40" height="34" rx="9" fill="#ffffff"/>
+  <circle cx="24" cy="31" r="5" fill="#4f46e5"/>
+  <circle cx="40" cy="31" r="5" fill="#4f46e5"/>
+  <rect x="23" y="41" width="18" height="3" rx="1.5" fill="#4f46e5"/>
+</svg>
+"""
+
+# The static files the pages link to; the compress stage (script_6.py) precompresses them
+static_assets = {
+    'public/favicon.svg': favicon_svg,
+}
+
 # Basic home page
-home_page = """// pages/index.tsx - Landing page
+home_page = Template("""// pages/index.tsx - Landing page
 
 import React from 'react';
 import Head from 'next/head';
@@ -474,7 +531,7 @@ export default function Home() {
         <title>AI SaaS Platform - Advanced AI Tools for Everyone</title>
         <meta name="description" content="Powerful AI tools for text generation, image creation, code generation, and content summarization." />
         <meta name="viewport" content="width=device-width, initial-scale=1" />
-        <link rel="icon" href="/favicon.ico" />
+        <link rel="icon" href="[[ favicon ]]" />
       </Head>
 
       <div className="min-h-screen bg-gradient-to-br from-blue-50 to-indigo-100 dark:from-gray-900 dark:to-gray-800">
@@ -653,20 +710,116 @@ export default function Home() {
       </div>
     </>
   );
+}""", name="home_page", favicon=str).render(
+    favicon=asset_url('public/favicon.svg', favicon_svg) if tenant.precompress else '/favicon.ico',
+)
+
+# Dashboard: text generation rendered as it streams in
+dashboard_page = """// pages/dashboard/index.tsx - User dashboard with streaming text generation
+
+import React, { useEffect, useRef, useState } from 'react';
+import Head from 'next/head';
+import { TextUsage, streamText } from '@/lib/text-stream';
+
+export default function Dashboard() {
+  const [prompt, setPrompt] = useState('');
+  const [output, setOutput] = useState('');
+  const [usage, setUsage] = useState<TextUsage | null>(null);
+  const [error, setError] = useState<string | null>(null);
+  const [generating, setGenerating] = useState(false);
+  const controller = useRef<AbortController | null>(null);
+
+  // Leaving the page stops the generation on the server as well
+  useEffect(() => () => controller.current?.abort(), []);
+
+  const generate = async (event: React.FormEvent) => {
+    event.preventDefault();
+    const current = controller.current = new AbortController();
+    setOutput('');
+    setUsage(null);
+    setError(null);
+    setGenerating(true);
+    try {
+      // Authenticated by the session cookie the middleware already checked
+      setUsage(await streamText(prompt, {
+        maxLength: 500,
+        signal: current.signal,
+        onToken: text => setOutput(previous => previous + text)
+      }));
+    } catch (failure) {
+      if (!current.signal.aborted) {
+        setError(failure instanceof Error ? failure.message : 'Text generation failed');
+      }
+    } finally {
+      setGenerating(false);
+    }
+  };
+
+  return (
+    <>
+      <Head>
+        <title>Dashboard - AI Platform</title>
+      </Head>
+
+      <div className="min-h-screen">
+        <main className="max-w-3xl mx-auto px-4 sm:px-6 lg:px-8 py-12">
+          <h1 className="text-3xl font-bold text-gray-900 dark:text-white mb-8">
+            📝 Text Generation
+          </h1>
+
+          <form onSubmit={generate} className="card p-6 space-y-4">
+            <textarea
+              className="form-input h-32"
+              placeholder="Describe what you want to write..."
+              value={prompt}
+              onChange={event => setPrompt(event.target.value)}
+              disabled={generating}
+            />
+            <div className="flex gap-4">
+              <button type="submit" className="btn btn-primary" disabled={generating || !prompt.trim()}>
+                {generating ? <span className="spinner" /> : 'Generate'}
+              </button>
+              {generating && (
+                <button type="button" className="btn btn-outline" onClick={() => controller.current?.abort()}>
+                  Stop
+                </button>
+              )}
+            </div>
+          </form>
+
+          {error && (
+            <p className="mt-6 text-red-600 dark:text-red-400">{error}</p>
+          )}
+
+          {(output || generating) && (
+            <div className="card p-6 mt-6 animate-fadeIn">
+              <p className="whitespace-pre-wrap text-gray-800 dark:text-gray-100">{output}</p>
+              {usage && (
+                <p className="mt-4 text-sm text-gray-500 dark:text-gray-400">
+                  {usage.tokensUsed} tokens used
+                  {usage.remainingCredits >= 0 && ` · ${usage.remainingCredits} credits left this month`}
+                </p>
+              )}
+            </div>
+          )}
+        </main>
+      </div>
+    </>
+  );
 }"""
 
 # Write final files
 final_files = {
     'database/schema.sql': database_schema,
+    'database/schema.sqlite.sql': to_sqlite(database_schema),
     'README.md': readme_content,
     'styles/globals.css': global_styles,
     'pages/index.tsx': home_page
 }
+if tenant.has_tool('text-generation'):
+    final_files['pages/dashboard/index.tsx'] = dashboard_page
 
-for filepath, content in final_files.items():
-    full_path = os.path.join(project_name, filepath)
-    with open(full_path, 'w') as f:
-        f.write(content)
+emitter.write_files(final_files)
 
 print("✅ Added database schema and documentation:")
 for filepath in final_files.keys():
@@ -713,6 +866,8 @@ next-env.d.ts
 
 # Database
 *.db
+*.db-shm
+*.db-wal
 *.sqlite
 *.sqlite3
 
@@ -730,10 +885,13 @@ logs
 .npm
 .eslintcache
 .parcel-cache
-.cache/"""
+.cache/
+
+# Generator state
+.scaffold-manifest.json
+.scaffold-imports-cache.json"""
 
-with open(os.path.join(project_name, '.gitignore'), 'w') as f:
-    f.write(gitignore_content)
+emitter.write('.gitignore', gitignore_content)
 
 print("   ├── .gitignore")
 print("\n" + "="*60)
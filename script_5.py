@@ -1,31 +1,21 @@
 # Show the complete project structure
-import os
+from tree_walk import DEFAULT_IGNORE, TreeStats, format_size, walk_tree
 
-def show_directory_tree(path, prefix="", max_depth=3, current_depth=0):
-    if current_depth > max_depth:
-        return
-    
-    items = []
-    try:
-        for item in sorted(os.listdir(path)):
-            if not item.startswith('.'):
-                items.append(item)
-    except PermissionError:
-        return
-    
-    for i, item in enumerate(items):
-        item_path = os.path.join(path, item)
-        is_last = i == len(items) - 1
-        current_prefix = "└── " if is_last else "├── "
-        print(f"{prefix}{current_prefix}{item}")
-        
-        if os.path.isdir(item_path) and current_depth < max_depth:
-            next_prefix = prefix + ("    " if is_last else "│   ")
-            show_directory_tree(item_path, next_prefix, max_depth, current_depth + 1)
+# Finish pending writes, record the manifest and drop files that are no longer generated
+removed_files = emitter.close()
+build = emitter.totals()
+print(f"♻️  Incremental build: {build.written} written, "
+      f"{build.unchanged} unchanged, {len(removed_files)} removed")
+for filepath in removed_files:
+    print(f"   ├── removed {filepath}")
 
+# Render the tree, count files and sum sizes in a single scandir pass,
+# skipping node_modules / .next and streaming lines as they are produced
+tree_stats = TreeStats()
 print("📁 COMPLETE PROJECT STRUCTURE:")
-print("ai-saas-platform/")
-show_directory_tree("ai-saas-platform")
+print(f"{project_name}/")
+for line in walk_tree(emitter.root, max_depth=3, ignore=DEFAULT_IGNORE, stats=tree_stats):
+    print(line)
 
 print("\n" + "="*60)
 print("🚀 READY TO PUSH TO GITHUB!")
@@ -72,13 +62,10 @@ Your complete AI SaaS platform is now ready! Here's what's included:
 That's it! Your full-stack AI SaaS platform is ready for deployment! 🎉
 """)
 
-# Count total files
-total_files = 0
-for root, dirs, files in os.walk("ai-saas-platform"):
-    total_files += len(files)
-
 print(f"📊 Project Stats:")
-print(f"   • Total Files: {total_files}")
-print(f"   • Project Size: Ready for production")
+print(f"   • Total Files: {tree_stats.files} in {tree_stats.dirs} folders")
+print(f"   • Project Size: {format_size(tree_stats.bytes)}")
+for folder, size in sorted(tree_stats.bytes_by_top_level.items(), key=lambda item: -item[1]):
+    print(f"     ├── {folder}: {format_size(size)}")
 print(f"   • Features: Authentication, AI Tools, Admin Panel, Database")
 print(f"   • Technologies: Next.js, TypeScript, TailwindCSS, Supabase")
\ No newline at end of file
@@ -0,0 +1,9 @@
+# Precompress the static assets the pages link to (opt-in per tenant)
+from precompress import encodings, precompress_assets
+
+if tenant.precompress:
+    emitter.write_files(precompress_assets(static_assets))
+
+    print("✅ Precompressed static assets:")
+    for filepath in static_assets:
+        print(f"   ├── {filepath} -> {', '.join(suffix for _, suffix, _ in encodings())}")
@@ -0,0 +1,292 @@
+# SQLite variant of the generated PostgreSQL schema
+#
+# database/schema.sql targets PostgreSQL (Supabase): gen_random_uuid(),
+# JSONB, INET and a PL/pgSQL trigger function. to_sqlite() rewrites it into
+# database/schema.sqlite.sql (plus the user search table, analytics
+# rollups, the shared response cache and the generation job queue), which
+# lib/db.ts applies when it opens the database. Every statement is
+# idempotent (IF NOT EXISTS / INSERT OR IGNORE), so the script can run on
+# each start.
+# The result is executed against an in-memory SQLite database at generation
+# time, so a template change that SQLite cannot run fails the build instead
+# of the first request.
+import re
+import sqlite3
+
+# 16 random bytes formatted as a version 4 UUID, like gen_random_uuid()
+SQLITE_UUID = (
+    "(lower(hex(randomblob(4))) || '-' || lower(hex(randomblob(2))) || '-4' || "
+    "substr(lower(hex(randomblob(2))), 2) || '-' || "
+    "substr('89ab', 1 + (abs(random()) % 4), 1) || substr(lower(hex(randomblob(2))), 2) || '-' || "
+    "lower(hex(randomblob(6))))"
+)
+
+_REWRITES = [
+    (re.compile(r"\bUUID DEFAULT gen_random_uuid\(\)"), f"TEXT DEFAULT {SQLITE_UUID}"),
+    (re.compile(r"\bUUID\b"), "TEXT"),
+    # Stored as text; json_valid() keeps the column honest
+    (re.compile(r"^(\s+)(\w+) JSONB,", re.MULTILINE), r"\1\2 TEXT CHECK (\2 IS NULL OR json_valid(\2)),"),
+    (re.compile(r"\bINET\b"), "TEXT"),
+    (re.compile(r"^CREATE TABLE ", re.MULTILINE), "CREATE TABLE IF NOT EXISTS "),
+    (re.compile(r"^CREATE INDEX ", re.MULTILINE), "CREATE INDEX IF NOT EXISTS "),
+    (re.compile(r"^INSERT INTO ", re.MULTILINE), "INSERT OR IGNORE INTO "),
+    (re.compile(r"^-- Compatible with .*$", re.MULTILINE), "-- SQLite variant generated from schema.sql"),
+]
+
+_PG_FUNCTION_RE = re.compile(r"^-- Functions for updating timestamps.*?\$\$ language 'plpgsql';\n*",
+                             re.MULTILINE | re.DOTALL)
+_PG_TRIGGER_RE = re.compile(
+    r"^CREATE TRIGGER (\w+) BEFORE UPDATE ON (\w+)\s*\n"
+    r"FOR EACH ROW EXECUTE FUNCTION update_updated_at_column\(\);",
+    re.MULTILINE,
+)
+
+# Turns the PostgreSQL BEFORE UPDATE trigger into an AFTER UPDATE one. The WHEN
+# clause stops the trigger's own UPDATE from firing it again.
+_SQLITE_TRIGGER = """CREATE TRIGGER IF NOT EXISTS {name} AFTER UPDATE ON {table}
+FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+END;"""
+
+# SQLite-only additions: an FTS5 index for the admin user search, kept in
+# sync by triggers. The backfill covers rows inserted before the triggers
+# existed (the sample data, or a database created by an older schema).
+_SQLITE_SEARCH = """
+
+-- Word-prefix search over user names and emails (SQLite only)
+CREATE VIRTUAL TABLE IF NOT EXISTS users_search USING fts5(name, email, prefix='2 3');
+
+CREATE TRIGGER IF NOT EXISTS users_search_insert AFTER INSERT ON users
+BEGIN
+    INSERT INTO users_search (rowid, name, email) VALUES (NEW.rowid, NEW.name, NEW.email);
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_search_update AFTER UPDATE OF name, email ON users
+BEGIN
+    UPDATE users_search SET name = NEW.name, email = NEW.email WHERE rowid = NEW.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_search_delete AFTER DELETE ON users
+BEGIN
+    DELETE FROM users_search WHERE rowid = OLD.rowid;
+END;
+
+INSERT INTO users_search (rowid, name, email)
+SELECT rowid, name, email FROM users WHERE rowid NOT IN (SELECT rowid FROM users_search);
+"""
+
+# Analytics rollups, updated by triggers as rows land, so /api/admin/analytics
+# reads a handful of rows instead of aggregating ai_usage. Usage is counted
+# per hour and per day for every tool and plan (the user's subscription when
+# the row landed); the totals tables hold the running sums, including each
+# user's token total, which lib/db.ts returns as User.totalUsage with a key
+# lookup instead of summing the user's usage history. lib/analytics.ts can
+# rebuild all of them from the raw tables (npm run rollups:backfill).
+_SQLITE_ROLLUPS = """
+
+-- Analytics rollups (SQLite only)
+CREATE TABLE IF NOT EXISTS usage_rollup_hourly (
+    bucket TEXT NOT NULL, -- 'YYYY-MM-DD HH:00'
+    tool_type VARCHAR(50) NOT NULL,
+    plan VARCHAR(20) NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, tool_type, plan)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS usage_rollup_daily (
+    bucket TEXT NOT NULL, -- 'YYYY-MM-DD'
+    tool_type VARCHAR(50) NOT NULL,
+    plan VARCHAR(20) NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, tool_type, plan)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS usage_rollup_totals (
+    tool_type VARCHAR(50) NOT NULL,
+    plan VARCHAR(20) NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tool_type, plan)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS signup_rollup_daily (
+    bucket TEXT NOT NULL, -- 'YYYY-MM-DD'
+    plan VARCHAR(20) NOT NULL,
+    signups INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, plan)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_rollup_totals (
+    plan VARCHAR(20) PRIMARY KEY,
+    users INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- Last AI request per user, for the active user count
+CREATE TABLE IF NOT EXISTS user_activity (
+    user_id TEXT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    last_used_at TIMESTAMP NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_user_activity_last_used_at ON user_activity(last_used_at);
+
+-- Tokens used per user, all time
+CREATE TABLE IF NOT EXISTS user_usage_totals (
+    user_id TEXT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    tokens INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS ai_usage_rollup AFTER INSERT ON ai_usage
+BEGIN
+    INSERT INTO usage_rollup_hourly (bucket, tool_type, plan, requests, tokens, failures)
+    VALUES (strftime('%Y-%m-%d %H:00', NEW.created_at), NEW.tool_type,
+            COALESCE((SELECT subscription FROM users WHERE id = NEW.user_id), 'Starter'),
+            1, COALESCE(NEW.tokens_used, 0), NEW.success IS NOT 1)
+    ON CONFLICT (bucket, tool_type, plan) DO UPDATE SET
+        requests = requests + 1, tokens = tokens + excluded.tokens, failures = failures + excluded.failures;
+
+    INSERT INTO usage_rollup_daily (bucket, tool_type, plan, requests, tokens, failures)
+    VALUES (date(NEW.created_at), NEW.tool_type,
+            COALESCE((SELECT subscription FROM users WHERE id = NEW.user_id), 'Starter'),
+            1, COALESCE(NEW.tokens_used, 0), NEW.success IS NOT 1)
+    ON CONFLICT (bucket, tool_type, plan) DO UPDATE SET
+        requests = requests + 1, tokens = tokens + excluded.tokens, failures = failures + excluded.failures;
+
+    INSERT INTO usage_rollup_totals (tool_type, plan, requests, tokens, failures)
+    VALUES (NEW.tool_type, COALESCE((SELECT subscription FROM users WHERE id = NEW.user_id), 'Starter'),
+            1, COALESCE(NEW.tokens_used, 0), NEW.success IS NOT 1)
+    ON CONFLICT (tool_type, plan) DO UPDATE SET
+        requests = requests + 1, tokens = tokens + excluded.tokens, failures = failures + excluded.failures;
+
+    INSERT INTO user_activity (user_id, last_used_at) VALUES (NEW.user_id, NEW.created_at)
+    ON CONFLICT (user_id) DO UPDATE SET last_used_at = max(last_used_at, excluded.last_used_at);
+END;
+
+CREATE TRIGGER IF NOT EXISTS ai_usage_user_totals AFTER INSERT ON ai_usage
+BEGIN
+    INSERT INTO user_usage_totals (user_id, tokens) VALUES (NEW.user_id, COALESCE(NEW.tokens_used, 0))
+    ON CONFLICT (user_id) DO UPDATE SET tokens = tokens + excluded.tokens;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_rollup_insert AFTER INSERT ON users
+BEGIN
+    INSERT INTO signup_rollup_daily (bucket, plan, signups)
+    VALUES (date(NEW.created_at), NEW.subscription, 1)
+    ON CONFLICT (bucket, plan) DO UPDATE SET signups = signups + 1;
+
+    INSERT INTO user_rollup_totals (plan, users) VALUES (NEW.subscription, 1)
+    ON CONFLICT (plan) DO UPDATE SET users = users + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_rollup_plan AFTER UPDATE OF subscription ON users
+WHEN NEW.subscription IS NOT OLD.subscription
+BEGIN
+    UPDATE user_rollup_totals SET users = users - 1 WHERE plan = OLD.subscription;
+    INSERT INTO user_rollup_totals (plan, users) VALUES (NEW.subscription, 1)
+    ON CONFLICT (plan) DO UPDATE SET users = users + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_rollup_delete AFTER DELETE ON users
+BEGIN
+    UPDATE user_rollup_totals SET users = users - 1 WHERE plan = OLD.subscription;
+END;
+
+-- Sample users inserted before the triggers existed
+INSERT INTO signup_rollup_daily (bucket, plan, signups)
+SELECT date(created_at), subscription, COUNT(*) FROM users
+WHERE NOT EXISTS (SELECT 1 FROM user_rollup_totals)
+GROUP BY date(created_at), subscription;
+
+INSERT INTO user_rollup_totals (plan, users)
+SELECT subscription, COUNT(*) FROM users
+WHERE NOT EXISTS (SELECT 1 FROM user_rollup_totals)
+GROUP BY subscription;
+
+-- Usage recorded before the per-user totals existed
+INSERT INTO user_usage_totals (user_id, tokens)
+SELECT user_id, COALESCE(SUM(tokens_used), 0) FROM ai_usage
+WHERE user_id IN (SELECT id FROM users) AND NOT EXISTS (SELECT 1 FROM user_usage_totals)
+GROUP BY user_id;
+"""
+
+# Exact-match cache of AI responses shared by every server process
+# (RESPONSE_CACHE=sqlite, see lib/response-cache.ts). Times are ms since the
+# epoch; last_used orders the LRU eviction.
+_SQLITE_RESPONSE_CACHE = """
+
+-- AI response cache (SQLite only)
+CREATE TABLE IF NOT EXISTS response_cache (
+    key TEXT PRIMARY KEY, -- sha256 of the tool, model, prompt and parameters
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at INTEGER NOT NULL,
+    last_used INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_response_cache_expires_at ON response_cache(expires_at);
+CREATE INDEX IF NOT EXISTS idx_response_cache_last_used ON response_cache(last_used);
+"""
+
+_SQLITE_JOBS = """
+
+-- Generation job queue (SQLite only; see lib/jobs.ts)
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    tool_type VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+    request TEXT NOT NULL CHECK (json_valid(request)),
+    result TEXT CHECK (result IS NULL OR json_valid(result)),
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    locked_until INTEGER, -- lease of the worker running the job
+    created_at INTEGER NOT NULL,
+    started_at INTEGER,
+    finished_at INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_generation_jobs_queue ON generation_jobs(tool_type, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_generation_jobs_user_id ON generation_jobs(user_id);
+"""
+
+_SQLITE_PRAGMAS = """-- Applied by lib/db.ts on every connection as well
+PRAGMA foreign_keys = ON;
+
+"""
+
+
+class SchemaError(ValueError):
+    pass
+
+
+def to_sqlite(schema, check=True):
+    """Rewrite the PostgreSQL ``schema`` into a script SQLite can run."""
+    sql = schema
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+    sql = _PG_FUNCTION_RE.sub("", sql)
+    sql = _PG_TRIGGER_RE.sub(lambda m: _SQLITE_TRIGGER.format(name=m.group(1), table=m.group(2)), sql)
+    sql = "".join(line.rstrip() + "\n" for line in sql.splitlines())
+
+    header, _, body = sql.partition("\n\n")
+    sql = f"{header}\n\n{_SQLITE_PRAGMAS}{body.rstrip()}{_SQLITE_SEARCH}{_SQLITE_ROLLUPS}{_SQLITE_RESPONSE_CACHE}{_SQLITE_JOBS}"
+    if check:
+        check_script(sql)
+    return sql
+
+
+def check_script(sql):
+    """Run ``sql`` twice on an empty in-memory database (it must be idempotent)."""
+    connection = sqlite3.connect(":memory:")
+    try:
+        for _ in range(2):
+            connection.executescript(sql)
+    except sqlite3.Error as error:
+        raise SchemaError(f"SQLite schema does not run: {error}") from None
+    finally:
+        connection.close()
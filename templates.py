@@ -0,0 +1,213 @@
+# Precompiled, parameterized templates for the generator
+#
+# A template is parsed once per process and compiled into a plain Python
+# render function, so rendering thousands of tenant variants costs one
+# function call each. The syntax is chosen not to collide with the
+# TypeScript, TSX, CSS and SQL the templates contain:
+#
+#   [[ expr ]]                        insert str(expr)
+#   [% if expr %] .. [% elif expr %] .. [% else %] .. [% endif %]
+#   [% for a, b in expr %] .. [% endfor %]       (dicts iterate their items)
+#
+# Expressions may only use the declared parameters, loop variables,
+# literals, attribute / item access, comparisons and boolean operators.
+# A block tag alone on its line swallows that whole line, so templates keep
+# the exact layout of the files they produce.
+#
+#   tailwind = Template(source, name="tailwind_config", primary_colors=dict)
+#   tailwind(primary_colors={...})
+#
+# Parameters are declared as name=type or name=(type, default); rendering
+# checks the types and rejects unknown parameters.
+import ast
+import re
+
+_TAG_RE = re.compile(r"(\[\[.*?\]\]|\[%.*?%\])", re.DOTALL)
+_FOR_RE = re.compile(r"^for\s+(.+?)\s+in\s+(.+)$", re.DOTALL)
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.Name, ast.Load, ast.Constant, ast.Attribute, ast.Subscript,
+    ast.Compare, ast.BoolOp, ast.UnaryOp, ast.BinOp, ast.Tuple, ast.List,
+    ast.And, ast.Or, ast.Not, ast.USub, ast.Add, ast.Sub, ast.Mult,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot,
+)
+
+_compiled = {}
+_MISSING = object()
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def _items(value):
+    return value.items() if isinstance(value, dict) else value
+
+
+class _Compiler:
+    def __init__(self, source, name, params):
+        self.source = source
+        self.name = name
+        self.params = params
+        self.lines = []
+        self.indent = 1
+        self.scopes = [set(params)]
+        self.blocks = []
+
+    def error(self, message, offset):
+        line = self.source.count("\n", 0, offset) + 1
+        return TemplateError(f"{self.name}, line {line}: {message}")
+
+    def emit(self, code):
+        self.lines.append("    " * self.indent + code)
+
+    def expression(self, text, offset):
+        try:
+            tree = ast.parse(text.strip(), mode="eval")
+        except SyntaxError:
+            raise self.error(f"invalid expression: {text.strip()!r}", offset) from None
+        visible = set().union(*self.scopes)
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise self.error(f"unsupported syntax in {text.strip()!r}", offset)
+            if isinstance(node, ast.Name):
+                if node.id not in visible:
+                    raise self.error(f"unknown name {node.id!r}", offset)
+                node.id = "v_" + node.id
+            if isinstance(node, ast.Attribute) and node.attr.startswith("_"):
+                raise self.error(f"private attribute in {text.strip()!r}", offset)
+        return ast.unparse(tree)
+
+    def tokens(self):
+        """Split the source into text and tags, dropping lines that only hold a block tag."""
+        parts = _TAG_RE.split(self.source)
+        offsets, position = [], 0
+        for part in parts:
+            offsets.append(position)
+            position += len(part)
+
+        starts_line = True  # does parts[index - 1] start at the beginning of a line?
+        for index in range(1, len(parts), 2):
+            before, after = parts[index - 1], parts[index + 1]
+            newline = before.rfind("\n")
+            standalone = (
+                parts[index].startswith("[%")
+                and before[newline + 1:].strip(" \t") == ""
+                and (newline >= 0 or starts_line)
+                and (after.startswith("\n") or (after == "" and index + 1 == len(parts) - 1))
+            )
+            if standalone:
+                parts[index - 1] = before[:newline + 1]
+                parts[index + 1] = after[1:]
+            starts_line = standalone
+
+        tokens = []
+        for index, part in enumerate(parts):
+            if index % 2 == 0:
+                tokens.append(("text", part, offsets[index]))
+            else:
+                tokens.append(("expr" if part.startswith("[[") else "block", part, offsets[index]))
+        return tokens
+
+    def compile(self):
+        for kind, text, offset in self.tokens():
+            if kind == "text":
+                if text:
+                    self.emit(f"_a({text!r})")
+            elif kind == "expr":
+                self.emit(f"_a(str({self.expression(text[2:-2], offset)}))")
+            else:
+                self.block(text[2:-2].strip(), offset)
+        if self.blocks:
+            raise self.error(f"unclosed [% {self.blocks[-1]} %]", len(self.source))
+
+        args = ", ".join("v_" + name for name in self.params)
+        body = "\n".join(self.lines)
+        return (f"def render({args}):\n"
+                f"    _o = []\n"
+                f"    _a = _o.append\n"
+                f"{body}\n"
+                f"    return ''.join(_o)\n")
+
+    def block(self, tag, offset):
+        keyword = tag.split(None, 1)[0] if tag else ""
+        if keyword == "if":
+            self.emit(f"if {self.expression(tag[2:], offset)}:")
+            self.indent += 1
+            self.emit("pass")
+            self.blocks.append("if")
+        elif keyword in ("elif", "else"):
+            if not self.blocks or self.blocks[-1] != "if":
+                raise self.error(f"[% {keyword} %] outside of [% if %]", offset)
+            self.indent -= 1
+            if keyword == "elif":
+                self.emit(f"elif {self.expression(tag[4:], offset)}:")
+            else:
+                self.emit("else:")
+            self.indent += 1
+            self.emit("pass")
+        elif keyword == "for":
+            match = _FOR_RE.match(tag)
+            if not match:
+                raise self.error(f"invalid for tag: {tag!r}", offset)
+            names = [name.strip() for name in match.group(1).split(",")]
+            if not all(name.isidentifier() for name in names):
+                raise self.error(f"invalid loop variables: {match.group(1)!r}", offset)
+            iterable = self.expression(match.group(2), offset)
+            self.emit(f"for {', '.join('v_' + name for name in names)} in _items({iterable}):")
+            self.indent += 1
+            self.emit("pass")
+            self.scopes.append(set(names))
+            self.blocks.append("for")
+        elif keyword in ("endif", "endfor"):
+            expected = keyword[3:]
+            if not self.blocks or self.blocks[-1] != expected:
+                raise self.error(f"unexpected [% {keyword} %]", offset)
+            self.blocks.pop()
+            if expected == "for":
+                self.scopes.pop()
+            self.indent -= 1
+        else:
+            raise self.error(f"unknown tag: [% {tag} %]", offset)
+
+
+def compile_template(source, name, param_names):
+    """Return the render function for ``source``, compiling it on first use."""
+    key = (source, param_names)
+    render = _compiled.get(key)
+    if render is None:
+        code = _Compiler(source, name, param_names).compile()
+        namespace = {"_items": _items}
+        exec(compile(code, f"<template {name}>", "exec"), namespace)
+        render = _compiled[key] = namespace["render"]
+    return render
+
+
+class Template:
+    def __init__(self, source, name="<template>", **params):
+        self.name = name
+        self.types = {}
+        self.defaults = {}
+        for param, spec in params.items():
+            if isinstance(spec, tuple):
+                self.types[param], self.defaults[param] = spec
+            else:
+                self.types[param] = spec
+        self._render = compile_template(source, name, tuple(params))
+
+    def __call__(self, **values):
+        unknown = set(values) - set(self.types)
+        if unknown:
+            raise TypeError(f"{self.name}: unknown parameters {sorted(unknown)}")
+        args = []
+        for param, expected in self.types.items():
+            value = values.get(param, self.defaults.get(param, _MISSING))
+            if value is _MISSING:
+                raise TypeError(f"{self.name}: missing parameter {param!r}")
+            if not isinstance(value, expected):
+                raise TypeError(f"{self.name}: parameter {param!r} must be "
+                                f"{getattr(expected, '__name__', expected)}, got {type(value).__name__}")
+            args.append(value)
+        return self._render(*args)
+
+    render = __call__
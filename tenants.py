@@ -0,0 +1,108 @@
+# Tenant configuration for the generator
+#
+# A tenant is one customer copy of the platform: its folder / package name,
+# the primary brand palette used in tailwind.config.ts, which AI tool
+# endpoints are generated, the database backend, the monthly credit
+# allowance of the Starter plan, whether static assets are precompressed
+# and whether the middleware verifies tokens with Web Crypto so it can run
+# on the edge runtime. The default tenant reproduces the stock ai-saas-platform
+# output byte for byte.
+#
+# The scripts read the tenant with current_tenant(); the batch driver
+# activates a different tenant per run.
+import json
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+DEFAULT_PRIMARY_COLORS = {
+    "50": "#eff6ff",
+    "100": "#dbeafe",
+    "200": "#bfdbfe",
+    "300": "#93c5fd",
+    "400": "#60a5fa",
+    "500": "#3b82f6",
+    "600": "#2563eb",
+    "700": "#1d4ed8",
+    "800": "#1e40af",
+    "900": "#1e3a8a",
+}
+
+AI_TOOLS = ("text-generation", "image-generation")
+DATABASES = ("supabase", "sqlite")
+
+_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9._-]*$")
+_COLOR_RE = re.compile(r"^#[0-9a-fA-F]{3}([0-9a-fA-F]{3})?$")
+
+
+@dataclass(frozen=True)
+class Tenant:
+    name: str = "ai-saas-platform"
+    primary_colors: dict = field(default_factory=lambda: dict(DEFAULT_PRIMARY_COLORS))
+    tools: tuple = AI_TOOLS
+    database: str = "supabase"
+    credit_limit: int = 1000
+    precompress: bool = False
+    edge_auth: bool = False
+
+    def __post_init__(self):
+        if not _NAME_RE.match(self.name):
+            raise ValueError(f"Invalid tenant name (use a lowercase package name): {self.name!r}")
+        unknown = set(self.primary_colors) - set(DEFAULT_PRIMARY_COLORS)
+        if unknown:
+            raise ValueError(f"Unknown primary color shades for {self.name}: {sorted(unknown)}")
+        for shade, color in self.primary_colors.items():
+            if not _COLOR_RE.match(color):
+                raise ValueError(f"Invalid color for {self.name} primary.{shade}: {color!r}")
+        unknown = set(self.tools) - set(AI_TOOLS)
+        if unknown:
+            raise ValueError(f"Unknown tools for {self.name}: {sorted(unknown)}")
+        if self.database not in DATABASES:
+            raise ValueError(f"Unknown database for {self.name}: {self.database!r}")
+        if not isinstance(self.credit_limit, int) or self.credit_limit <= 0:
+            raise ValueError(f"Invalid credit_limit for {self.name}: {self.credit_limit!r}")
+        if not isinstance(self.precompress, bool):
+            raise ValueError(f"Invalid precompress for {self.name}: {self.precompress!r}")
+        if not isinstance(self.edge_auth, bool):
+            raise ValueError(f"Invalid edge_auth for {self.name}: {self.edge_auth!r}")
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        # Partial palettes override the default shades
+        data["primary_colors"] = {**DEFAULT_PRIMARY_COLORS, **data.get("primary_colors", {})}
+        if "tools" in data:
+            data["tools"] = tuple(data["tools"])
+        return cls(**data)
+
+    def has_tool(self, tool):
+        return tool in self.tools
+
+
+def load_tenants(path):
+    with open(path, encoding="utf-8") as f:
+        tenants = [Tenant.from_dict(item) for item in json.load(f)]
+    names = [tenant.name for tenant in tenants]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate tenant names: {', '.join(duplicates)}")
+    return tenants
+
+
+DEFAULT_TENANT = Tenant()
+_active = None
+
+
+def current_tenant():
+    """Return the tenant activated by the driver, or the default tenant."""
+    return _active if _active is not None else DEFAULT_TENANT
+
+
+@contextmanager
+def activate(tenant):
+    global _active
+    previous, _active = _active, tenant
+    try:
+        yield tenant
+    finally:
+        _active = previous
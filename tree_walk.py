@@ -0,0 +1,85 @@
+# Single-pass directory tree walker for the project report
+#
+# One os.scandir traversal renders the tree, counts files and folders and sums
+# file sizes. Directory entries carry their type from the directory listing,
+# so only regular files are stat'ed (for their size). Lines are yielded as
+# soon as they are produced, and ignored folders such as node_modules are
+# never entered.
+import fnmatch
+import os
+from dataclasses import dataclass, field
+
+DEFAULT_IGNORE = ("node_modules", ".next", ".git")
+
+
+@dataclass
+class TreeStats:
+    files: int = 0
+    dirs: int = 0
+    bytes: int = 0
+    files_by_extension: dict = field(default_factory=dict)
+    bytes_by_top_level: dict = field(default_factory=dict)
+
+
+def format_size(num_bytes):
+    if num_bytes < 1024:
+        return f"{num_bytes} B"
+    if num_bytes < 1024 * 1024:
+        return f"{num_bytes / 1024:.1f} KB"
+    return f"{num_bytes / (1024 * 1024):.1f} MB"
+
+
+def _ignored(name, relpath, ignore):
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relpath, pattern)
+               for pattern in ignore)
+
+
+def walk_tree(root, max_depth=3, ignore=DEFAULT_IGNORE, show_hidden=False, stats=None):
+    """Yield the lines of a tree rendering of ``root``.
+
+    Folders deeper than ``max_depth`` are not rendered but still counted in
+    ``stats``. Entries matching an ``ignore`` glob (by name or by path
+    relative to ``root``) are skipped entirely. Hidden entries are counted
+    but only rendered with ``show_hidden``.
+    """
+    stats = stats if stats is not None else TreeStats()
+    yield from _walk(root, "", "", 0, max_depth, tuple(ignore), show_hidden, stats, None)
+
+
+def _walk(path, relpath, prefix, depth, max_depth, ignore, show_hidden, stats, top_level):
+    try:
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except (PermissionError, FileNotFoundError):
+        return
+
+    entries = [entry for entry in entries
+               if not _ignored(entry.name, relpath + entry.name, ignore)]
+    render = depth <= max_depth
+    visible = [entry for entry in entries if show_hidden or not entry.name.startswith(".")]
+    last_visible = visible[-1] if visible else None
+
+    for entry in entries:
+        entry_relpath = relpath + entry.name
+        is_dir = entry.is_dir(follow_symlinks=False)
+        shown = render and (show_hidden or not entry.name.startswith("."))
+        is_last = entry is last_visible
+
+        if shown:
+            yield f"{prefix}{'└── ' if is_last else '├── '}{entry.name}"
+
+        if is_dir:
+            stats.dirs += 1
+            next_prefix = prefix + ("    " if is_last else "│   ")
+            # Below the render depth (or under a hidden folder) keep walking for the stats only
+            child_render_depth = depth + 1 if shown else max_depth + 1
+            yield from _walk(entry.path, entry_relpath + "/", next_prefix, child_render_depth,
+                             max_depth, ignore, show_hidden, stats, top_level or entry.name)
+        elif entry.is_file(follow_symlinks=False):
+            size = entry.stat(follow_symlinks=False).st_size
+            ext = os.path.splitext(entry.name)[1] or entry.name
+            stats.files += 1
+            stats.bytes += size
+            stats.files_by_extension[ext] = stats.files_by_extension.get(ext, 0) + 1
+            folder = top_level or "."
+            stats.bytes_by_top_level[folder] = stats.bytes_by_top_level.get(folder, 0) + size
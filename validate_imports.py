@@ -0,0 +1,300 @@
+# Import-graph validator for the generated TypeScript
+#
+# Resolves every import in the emitted .ts / .tsx files against the generated
+# tree (tsconfig "paths" such as "@/*", relative paths, index files) and
+# checks that named and default imports are actually exported by the target
+# module. Bare package imports must be declared in package.json. This
+# catches broken templates, such as a missing export or a route written to
+# the wrong path, in well under a second and without node_modules or tsc.
+#
+# Files are parsed in parallel and the parse results are cached by content
+# hash in the output folder, so unchanged files are never parsed twice.
+#
+#   python validate_imports.py ai-saas-platform
+#   python generate.py --validate
+import json
+import os
+import posixpath
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from manifest import content_hash
+from tree_walk import DEFAULT_IGNORE
+
+CACHE_NAME = ".scaffold-imports-cache.json"
+CACHE_VERSION = 1
+SOURCE_EXTENSIONS = (".ts", ".tsx")
+RESOLVE_EXTENSIONS = (".ts", ".tsx", ".d.ts", ".js", ".jsx", ".json")
+# Below this many files a process pool costs more than it saves
+PARALLEL_THRESHOLD = 64
+
+NODE_BUILTINS = {
+    "assert", "buffer", "child_process", "cluster", "crypto", "dns", "events", "fs",
+    "http", "http2", "https", "net", "os", "path", "perf_hooks", "process", "querystring",
+    "readline", "stream", "string_decoder", "timers", "tls", "url", "util", "v8", "vm",
+    "worker_threads", "zlib",
+}
+
+_IMPORT_RE = re.compile(
+    r"^[ \t]*(import|export)\s+(type\s+)?([\w*{}\s,$]*?)\s*from\s*['\"]([^'\"]+)['\"]",
+    re.MULTILINE | re.DOTALL,
+)
+_SIDE_EFFECT_IMPORT_RE = re.compile(r"^[ \t]*import\s+['\"]([^'\"]+)['\"]", re.MULTILINE)
+_DYNAMIC_IMPORT_RE = re.compile(r"\bimport\(\s*['\"]([^'\"]+)['\"]\s*\)")
+_EXPORT_DECL_RE = re.compile(
+    r"^[ \t]*export\s+(?:declare\s+)?(?:abstract\s+)?(?:async\s+)?"
+    r"(?:interface|type|class|function\*?|const|let|var|enum)\s+([A-Za-z_$][\w$]*)",
+    re.MULTILINE,
+)
+_EXPORT_DEFAULT_RE = re.compile(r"^[ \t]*export\s+default\b", re.MULTILINE)
+_EXPORT_LIST_RE = re.compile(r"^[ \t]*export\s+(?:type\s+)?\{([^}]*)\}(?!\s*from)", re.MULTILINE)
+
+
+def _names(clause):
+    """Split an import / export clause into (imported, default?, namespace?) parts."""
+    clause = " ".join(clause.split())
+    named = []
+    default = namespace = False
+    braces = re.search(r"\{([^}]*)\}", clause)
+    if braces:
+        for item in braces.group(1).split(","):
+            item = item.strip()
+            if item.startswith("type "):
+                item = item[5:].strip()
+            if item:
+                named.append(item.split(" as ")[0].strip())
+        clause = clause[:braces.start()] + clause[braces.end():]
+    for part in (p.strip() for p in clause.split(",")):
+        if part.startswith("*"):
+            namespace = True
+        elif part:
+            default = True
+    return named, default, namespace
+
+
+def parse_source(text):
+    """Extract the imports and exports of one TypeScript module."""
+    imports, reexports = [], []
+    exports = set(_EXPORT_DECL_RE.findall(text))
+    if _EXPORT_DEFAULT_RE.search(text):
+        exports.add("default")
+    for body in _EXPORT_LIST_RE.findall(text):
+        for item in body.split(","):
+            item = item.strip()
+            if item.startswith("type "):
+                item = item[5:].strip()
+            if item:
+                exports.add(item.split(" as ")[-1].strip())
+
+    for match in _IMPORT_RE.finditer(text):
+        keyword, clause, spec = match.group(1), match.group(3), match.group(4)
+        line = text.count("\n", 0, match.start(4)) + 1
+        named, default, namespace = _names(clause)
+        if keyword == "import":
+            imports.append({"spec": spec, "line": line, "named": named, "default": default})
+            continue
+        # export ... from: a re-export
+        if clause.strip().startswith("*") and " as " not in clause:
+            reexports.append({"spec": spec, "line": line})
+        else:
+            for item in (clause.strip("{} ").split(",") if clause else []):
+                item = item.strip()
+                if item:
+                    exports.add(item.split(" as ")[-1].strip())
+        imports.append({"spec": spec, "line": line, "named": named if not namespace else [],
+                         "default": False})
+    for regex in (_SIDE_EFFECT_IMPORT_RE, _DYNAMIC_IMPORT_RE):
+        for match in regex.finditer(text):
+            line = text.count("\n", 0, match.start(1)) + 1
+            imports.append({"spec": match.group(1), "line": line, "named": [], "default": False})
+    return {"imports": imports, "exports": sorted(exports), "reexports": reexports}
+
+
+def _parse_file(args):
+    path, digest = args
+    with open(path, encoding="utf-8") as f:
+        return digest, parse_source(f.read())
+
+
+def find_sources(root, exclude=()):
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        reldir = os.path.relpath(dirpath, root).replace(os.sep, "/")
+        dirnames[:] = [d for d in dirnames if d not in DEFAULT_IGNORE
+                       and posixpath.normpath(posixpath.join(reldir, d)) not in exclude]
+        for filename in filenames:
+            if filename.endswith(SOURCE_EXTENSIONS):
+                sources.append(os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, "/"))
+    return sorted(sources)
+
+
+def _load_json(path, default):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+class ImportValidator:
+    def __init__(self, root, jobs=None):
+        self.root = root
+        self.jobs = jobs
+        tsconfig = _load_json(os.path.join(root, "tsconfig.json"), {})
+        options = tsconfig.get("compilerOptions", {})
+        self.base_url = posixpath.normpath(options.get("baseUrl", "."))
+        self.paths = options.get("paths", {})
+        self.exclude = {posixpath.normpath(path) for path in tsconfig.get("exclude", [])}
+        package = _load_json(os.path.join(root, "package.json"), {})
+        self.packages = set(package.get("dependencies", {})) | set(package.get("devDependencies", {}))
+        self.modules = {}
+        self.cache_hits = 0
+
+    # Parsing ---------------------------------------------------------------
+
+    def parse_all(self, sources):
+        cache_path = os.path.join(self.root, CACHE_NAME)
+        cache = _load_json(cache_path, {})
+        if cache.get("version") != CACHE_VERSION:
+            cache = {"version": CACHE_VERSION, "modules": {}}
+        cached = cache["modules"]
+
+        todo = []
+        digests = {}
+        for relpath in sources:
+            with open(os.path.join(self.root, relpath), "rb") as f:
+                digest = content_hash(f.read())
+            digests[relpath] = digest
+            if digest in cached:
+                self.modules[relpath] = cached[digest]
+                self.cache_hits += 1
+            else:
+                todo.append(relpath)
+
+        work = [(os.path.join(self.root, relpath), digests[relpath]) for relpath in todo]
+        if len(work) >= PARALLEL_THRESHOLD:
+            with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+                results = list(pool.map(_parse_file, work, chunksize=16))
+        else:
+            results = [_parse_file(item) for item in work]
+        for relpath, (digest, module) in zip(todo, results):
+            self.modules[relpath] = cached[digest] = module
+
+        # Keep only entries for files that still exist
+        cache["modules"] = {digests[relpath]: self.modules[relpath] for relpath in sources}
+        if todo or len(cache["modules"]) != len(cached):
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f, separators=(",", ":"))
+            os.replace(tmp_path, cache_path)
+
+    # Resolution ------------------------------------------------------------
+
+    def _candidates(self, base):
+        if base.endswith(RESOLVE_EXTENSIONS):
+            yield base
+        for ext in RESOLVE_EXTENSIONS:
+            yield base + ext
+        for ext in RESOLVE_EXTENSIONS:
+            yield posixpath.join(base, "index" + ext)
+
+    def _resolve_path(self, base):
+        for candidate in self._candidates(posixpath.normpath(base)):
+            if candidate in self.modules or os.path.isfile(os.path.join(self.root, candidate)):
+                return candidate
+        return None
+
+    def resolve(self, importer, spec):
+        """Return ("file", path), ("package", name) or (None, reason)."""
+        for pattern, targets in self.paths.items():
+            prefix = pattern.rstrip("*")
+            if (pattern.endswith("*") and spec.startswith(prefix)) or spec == pattern:
+                rest = spec[len(prefix):] if pattern.endswith("*") else ""
+                for target in targets:
+                    base = posixpath.join(self.base_url, target.replace("*", rest))
+                    resolved = self._resolve_path(base)
+                    if resolved:
+                        return "file", resolved
+                return None, f"'{spec}' matches tsconfig path '{pattern}' but no file exists"
+        if spec.startswith("."):
+            resolved = self._resolve_path(posixpath.join(posixpath.dirname(importer), spec))
+            return ("file", resolved) if resolved else (None, f"'{spec}' cannot be resolved")
+
+        parts = spec.split("/")
+        package = "/".join(parts[:2]) if spec.startswith("@") else parts[0]
+        if package.startswith("node:") or package in NODE_BUILTINS:
+            return "package", package
+        if package in self.packages:
+            return "package", package
+        return None, f"package '{package}' is not declared in package.json"
+
+    def exports_of(self, relpath, seen=None):
+        module = self.modules.get(relpath)
+        if module is None:
+            return None  # not a parsed TypeScript module (json, js): do not check names
+        seen = seen or set()
+        if relpath in seen:
+            return set()
+        seen.add(relpath)
+        exports = set(module["exports"])
+        for reexport in module["reexports"]:
+            kind, target = self.resolve(relpath, reexport["spec"])
+            if kind == "file":
+                target_exports = self.exports_of(target, seen)
+                if target_exports is None:
+                    return None
+                exports |= target_exports - {"default"}
+        return exports
+
+    # Validation ------------------------------------------------------------
+
+    def validate(self):
+        """Return a list of "file:line: message" errors."""
+        sources = find_sources(self.root, self.exclude)
+        self.parse_all(sources)
+        errors = []
+        for relpath in sources:
+            for item in self.modules[relpath]["imports"]:
+                kind, target = self.resolve(relpath, item["spec"])
+                if kind is None:
+                    errors.append(f"{relpath}:{item['line']}: {target}")
+                    continue
+                if kind != "file":
+                    continue
+                exports = self.exports_of(target)
+                if exports is None:
+                    continue
+                for name in item["named"]:
+                    if name not in exports:
+                        errors.append(f"{relpath}:{item['line']}: '{name}' is not exported by {target}")
+                if item["default"] and "default" not in exports:
+                    errors.append(f"{relpath}:{item['line']}: {target} has no default export")
+        return errors
+
+
+def validate_tree(root, jobs=None):
+    validator = ImportValidator(root, jobs=jobs)
+    return validator, validator.validate()
+
+
+def check_tree(root, jobs=None):
+    """Validate ``root``, print the problems and return an exit code."""
+    start = time.perf_counter()
+    validator, errors = validate_tree(root, jobs=jobs)
+    for error in errors:
+        print(f"❌ {error}")
+    print(f"🔎 Checked imports of {len(validator.modules)} files in "
+          f"{(time.perf_counter() - start) * 1000:.1f}ms ({validator.cache_hits} cached): "
+          f"{len(errors)} problem(s)")
+    return 1 if errors else 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    return check_tree(argv[0] if argv else "ai-saas-platform")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
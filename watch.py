@@ -0,0 +1,131 @@
+# Watch mode for the generator
+#
+# Generates the project once, then polls the stage scripts. When a script
+# changes, only that stage (and the stages that depend on it) is re-run in
+# the namespace kept from the first run, and only the files whose rendered
+# content changed are written; everything else keeps its mtime, so the
+# Next.js dev server and tsc caches stay warm. Rapid saves are debounced.
+#
+# Every output file is mapped back to the template variable and script that
+# produced it, so a change is reported as e.g.
+#   pages/api/admin/analytics.ts <- admin_analytics_api (script_3.py)
+#
+#   python generate.py --watch
+import os
+import time
+import traceback
+
+from emitter import FileEmitter
+from manifest import content_hash
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def dependents(stages, changed):
+    """``changed`` plus every stage that (transitively) depends on one of them."""
+    result = set(changed)
+    grew = True
+    while grew:
+        grew = False
+        for name, (_, deps) in stages.items():
+            if name not in result and result.intersection(deps):
+                result.add(name)
+                grew = True
+    return result
+
+
+def template_names(namespace, manifest):
+    """Map output paths to the template variables whose content they hold."""
+    names_by_digest = {}
+    for name, value in namespace.items():
+        if isinstance(value, str) and not name.startswith("_"):
+            names_by_digest.setdefault(content_hash(value), name)
+    return {path: names_by_digest.get(entry["sha256"]) for path, entry in manifest.current.items()}
+
+
+class Watcher:
+    def __init__(self, stages, order, run_stages, root, debounce=0.3, interval=0.25):
+        self.stages = stages
+        # The report stage reprints the whole tree; not useful on every save
+        self.order = [name for name in order if name != "report"]
+        self.run_stages = run_stages
+        self.root = root
+        self.debounce = debounce
+        self.interval = interval
+        self.namespace = None
+        self.sources = {}  # output path -> (template variable, script)
+        self.mtimes = {}
+
+    def _snapshot(self):
+        mtimes = {}
+        for name in self.order:
+            try:
+                mtimes[name] = os.stat(os.path.join(HERE, self.stages[name][0])).st_mtime_ns
+            except FileNotFoundError:
+                mtimes[name] = None
+        return mtimes
+
+    def build(self, stages):
+        """Re-run ``stages`` (in dependency order) and write what changed."""
+        order = [name for name in self.order if name in stages]
+        emitter = FileEmitter(self.root)
+        if self.namespace is None or "structure" in stages:
+            self.namespace = {"__name__": "__main__"}
+        # Stages after script.py write through the `emitter` it defined
+        self.namespace["emitter"] = emitter
+
+        start = time.perf_counter()
+        try:
+            self.run_stages(emitter, order, self.namespace)
+        except Exception:
+            traceback.print_exc()
+            emitter.close(prune=False)
+            print("❌ Build failed; keeping the previous output. Waiting for changes...")
+            return False
+
+        # Outputs a re-run stage no longer produces are removed
+        for path, (_, stage) in list(self.sources.items()):
+            if stage in stages and path not in emitter.outputs:
+                emitter.remove(path)
+                del self.sources[path]
+                print(f"   ├── removed {path}")
+        # A rebuild of every stage may also drop files left over from older runs
+        full = set(self.stages) - {"report"} <= set(order)
+        removed = emitter.close(prune=full)
+        for path in removed:
+            print(f"   ├── removed {path}")
+
+        names = template_names(self.namespace, emitter.manifest)
+        for path, stage in emitter.outputs.items():
+            self.sources[path] = (names.get(path) or "?", stage)
+        for path in sorted(emitter.written_paths):
+            variable, stage = self.sources[path]
+            print(f"   ├── {path} <- {variable} ({self.stages[stage][0]})")
+        total = emitter.totals()
+        print(f"🔁 Rebuilt {', '.join(order)} in {(time.perf_counter() - start) * 1000:.1f}ms: "
+              f"{total.written} written, {total.unchanged} unchanged")
+        return True
+
+    def run(self):
+        print(f"👀 Watching {len(self.order)} stage scripts (Ctrl+C to stop)")
+        self.mtimes = self._snapshot()
+        self.build(set(self.order))
+        try:
+            while True:
+                time.sleep(self.interval)
+                current = self._snapshot()
+                if current == self.mtimes:
+                    continue
+                # Debounce: wait until the scripts stop changing
+                while True:
+                    time.sleep(self.debounce)
+                    settled = self._snapshot()
+                    if settled == current:
+                        break
+                    current = settled
+                changed = {name for name in self.order if current[name] != self.mtimes[name]}
+                self.mtimes = current
+                print(f"\n✏️  Changed: {', '.join(self.stages[name][0] for name in sorted(changed))}")
+                self.build(dependents(self.stages, changed))
+        except KeyboardInterrupt:
+            print("\n👋 Stopped watching")